@@ -38,11 +38,15 @@ import joblib
 import mlem
 from sklearn.linear_model import LinearRegression
 from sklearn.tree import DecisionTreeRegressor
-from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import KFold
 from sklearn import tree
 from joblib import dump
 from mlem.api import save
+from encoder import load_encoder, save_encoder
+from splits import has_index_splits, load_split
+from poly_regression import cross_validate_linear, polynomial_regression
 
 
 # Display library versions
@@ -72,13 +76,18 @@ dt_random_state = dt_params.get("random_state", 1993)
 poly_degree = poly_linear_params.get("poly__degree", 2)
 poly_interaction_only = poly_linear_params.get("poly__interaction_only", False)
 
-# Load the data
-X_train = pd.read_parquet("data/transform/validation/X_train.parquet")
-X_test = pd.read_parquet("data/transform/validation/X_test.parquet")
-y_train = pd.read_parquet("data/transform/validation/y_train.parquet")
-y_test = pd.read_parquet("data/transform/validation/y_test.parquet")
-X_val = pd.read_parquet("data/transform/validation/X_val.parquet")
-y_val = pd.read_parquet("data/transform/validation/y_val.parquet")
+# Load the data, sliced from one memory mapped copy for index based splits
+if has_index_splits("data/transform/validation"):
+    X_train, y_train = load_split("data/transform/validation", "train")
+    X_test, y_test = load_split("data/transform/validation", "test")
+    X_val, y_val = load_split("data/transform/validation", "val")
+else:
+    X_train = pd.read_parquet("data/transform/validation/X_train.parquet")
+    X_test = pd.read_parquet("data/transform/validation/X_test.parquet")
+    y_train = pd.read_parquet("data/transform/validation/y_train.parquet")
+    y_test = pd.read_parquet("data/transform/validation/y_test.parquet")
+    X_val = pd.read_parquet("data/transform/validation/X_val.parquet")
+    y_val = pd.read_parquet("data/transform/validation/y_val.parquet")
 
 # Scale the data
 scaler = StandardScaler()
@@ -93,11 +102,11 @@ tree_model = DecisionTreeRegressor(
     random_state=dt_random_state,
 ).fit(X_train, y_train)
 
-# Instantiate and train the PolynomialFeatures + LinearRegression with best hyperparameters
-poly = PolynomialFeatures(degree=poly_degree, interaction_only=poly_interaction_only)
-X_train_poly = poly.fit_transform(X_train)
-X_val_poly = poly.transform(X_val)
-linear_model_poly = LinearRegression().fit(X_train_poly, y_train)
+# Instantiate and train the PolynomialFeatures + LinearRegression with best hyperparameters,
+# on standardized features and dropping dependent monomials like the tuning does
+linear_model_poly = polynomial_regression(poly_degree, poly_interaction_only).fit(
+    X_train, y_train
+)
 
 # Fit the linear model with the normalized data
 linear_model_scaled = LinearRegression().fit(X_train_scaled, y_train)
@@ -105,7 +114,18 @@ linear_model_scaled = LinearRegression().fit(X_train_scaled, y_train)
 # Predict the charges
 y_pred_linear_test = linear_model_scaled.predict(scaler.transform(X_test))
 y_pred_tree_test = tree_model.predict(X_test)
-y_pred_poly_test = linear_model_poly.predict(poly.transform(X_test))
+y_pred_poly_test = linear_model_poly.predict(X_test)
+
+# 5-fold cross validation MSE of the scaled linear and the polynomial model
+# above, the same as refitting them on every fold (see testing/),
+# from one pass over the fold statistics instead of a refit per fold
+cv_mse, _, _ = cross_validate_linear(
+    X_train,
+    y_train,
+    KFold(n_splits=5).split(X_train),
+    degrees=[1, poly_degree],
+    interaction_only=poly_interaction_only,
+)
 
 # Scoring the models with appropriate metrics
 print("\nEvaluating the models with the test and validation sets")
@@ -118,16 +138,20 @@ print(
 print("Tree model R² score on validation set:", tree_model.score(X_val, y_val))
 print(
     "Polynomial Linear Regression R² score on validation set:",
-    linear_model_poly.score(X_val_poly, y_val),
+    linear_model_poly.score(X_val, y_val),
 )
+print("Linear model 5-fold CV MSE:", cv_mse[0].mean())
+print("Polynomial Linear Regression 5-fold CV MSE:", cv_mse[1].mean())
 
 # Store the metrics in a dictionary
 metrics = {
-    "linear_model_mae": mean_absolute_error(y_test, y_pred_linear_test),
-    "tree_model_score": tree_model.score(X_test, y_test),
-    "linear_model_score_val": linear_model_scaled.score(X_val_scaled, y_val),
-    "tree_model_score_val": tree_model.score(X_val, y_val),
-    "linear_model_score_poly_val": linear_model_poly.score(X_val_poly, y_val),
+    "linear_model_mae": float(mean_absolute_error(y_test, y_pred_linear_test)),
+    "tree_model_score": float(tree_model.score(X_test, y_test)),
+    "linear_model_score_val": float(linear_model_scaled.score(X_val_scaled, y_val)),
+    "tree_model_score_val": float(tree_model.score(X_val, y_val)),
+    "linear_model_score_poly_val": float(linear_model_poly.score(X_val, y_val)),
+    "linear_model_cv_mse": float(cv_mse[0].mean()),
+    "linear_model_poly_cv_mse": float(cv_mse[1].mean()),
 }
 
 # Write the metrics to a JSON file
@@ -218,9 +242,13 @@ plt.tight_layout()
 plt.savefig("model_output/feature_importance_tree.png")
 
 # Save the models using MLEM
-save(linear_model_scaled, 'model/linear_model_scaled.mlem')
-save(tree_model, 'model/tree_model.mlem')
-save(linear_model_poly, 'model/polynomial_linear_model.mlem')
+save(linear_model_scaled, "model/linear_model_scaled.mlem")
+save(tree_model, "model/tree_model.mlem")
+save(linear_model_poly, "model/polynomial_linear_model.mlem")
+
+# Ship the encoder vocabularies with the models so scoring raw data
+# uses the same category codes the models were trained on
+save_encoder(load_encoder("data/transform/encoder.json"), "model/encoder.json")
 
 # Narrative on the findings
 # to be added
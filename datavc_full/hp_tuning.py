@@ -1,36 +1,127 @@
-"""Hyperparameter tuning for DecisionTreeRegressor and PolynomialFeatures + LinearRegression."""
+"""Hyperparameter tuning for DecisionTreeRegressor and PolynomialFeatures + LinearRegression.
+
+The optional "search" entry of hp_config.json picks the search strategy
+for both models, see search.py:
+
+    "search": {"strategy": "halving", "factor": 3}
+    "search": {"strategy": "random", "n_iter": 20}
+
+The default is an exhaustive grid search. Halving starts on enough
+rows for every training fold to grow the largest tree of the grid
+freely (twice max_leaf_nodes x min_samples_leaf rows) and to determine
+the largest polynomial fit (one row per expanded feature). On fewer
+rows the candidates fit the same stump, tie, and are pruned
+arbitrarily. For the grid of hp_config.json on the insurance data this
+is all rows, so halving gives the grid results.
+
+"racing" runs the first three folds, then the others one at a time,
+and prunes the candidates a paired t-test at that significance level
+finds worse than the best one so far; they are marked in the results.
+Each candidate is tested against the leader only, so a candidate about
+as good as the leader is pruned with a chance of about that level. It
+is off by default, and halving only races on its last rung:
+
+    "search": {"strategy": "grid", "racing": 0.05}
+
+All max_leaf_nodes of a tree and all degrees of a polynomial are
+scored from one shared fit per fold. Their fit times and peak RSS are
+those of the shared fit, so the results mark them as swept and leave
+them out of the Pareto front of accuracy against cost. "sweep": false
+fits every candidate on its own to measure its cost:
+
+    "search": {"strategy": "grid", "sweep": false}
+
+Both searches run at the same time in one pool of worker processes.
+The optional "resources" entry sets its CPU budget (default, or -1,
+all CPUs) and the BLAS threads of each worker (default 1):
+
+    "resources": {"cpus": 8, "blas_threads": 1}
+
+With a "queue" directory instead, the fits go through a file based work
+queue (see work_queue.py). "local_workers" worker processes are started
+here, and more can be started on any host sharing the directory with
+`python work_queue.py <queue>`:
+
+    "resources": {"queue": "data/hp_queue", "local_workers": 4}
+
+Every finished fit is saved in model_output/hp_trials.sqlite (see
+trials.py). An interrupted run resumes where it stopped, and growing a
+grid in hp_config.json only fits the new candidates.
+"""
 
 import json
+import math
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 from sklearn.tree import DecisionTreeRegressor
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.pipeline import Pipeline
-from sklearn.model_selection import GridSearchCV, train_test_split
+from sklearn.model_selection import train_test_split
+from parquet_io import read_parquet
+from poly_regression import cross_validate_degrees, polynomial_regression
+from search import SearchResult, TaskPool, as_arrays, search
+from splits import has_index_splits, load_cv_folds, load_split
+from trials import TrialStore
+from work_queue import WorkQueue
+from tree_sweep import cross_validate_leaf_nodes
 
 
 def tune_decision_tree(
-    X_train: pd.DataFrame, y_train: pd.Series, param_grid: dict
-) -> GridSearchCV:
-    """Tune DecisionTreeRegressor using GridSearchCV.
+    X_train: np.ndarray,
+    y_train: np.ndarray,
+    param_grid: dict,
+    search_config: dict = None,
+    pool: TaskPool = None,
+    store: TrialStore = None,
+    cv=5,
+) -> SearchResult:
+    """Tune DecisionTreeRegressor with cross validation.
 
     Parameters:
     -----------
-    X_train: pd.DataFrame
+    X_train: np.ndarray
 
-    y_train: pd.Series
+    y_train: np.ndarray
 
     param_grid: dict
 
+    search_config: dict
+        Search strategy and its options, see search.search
+
+    pool: TaskPool
+        Worker processes or a WorkQueue, shared with the other search
+
+    store: TrialStore
+        Finished fits, skipped when run again
+
+    cv: int or list
+        Number of folds, or the (train, test) folds of the split
+
     Returns:
     --------
-    GridSearchCV
+    SearchResult
 
     """
     model = DecisionTreeRegressor()
-    grid_search = GridSearchCV(model, param_grid, cv=5, n_jobs=-1, verbose=2)
-    grid_search.fit(X_train, y_train)
+    param_grid = {"max_leaf_nodes": [None], **param_grid}
+    search_config = dict(search_config or {})
+
+    # All max_leaf_nodes of the other parameters are scored from one tree
+    # per fold, grown best first to the largest leaf budget
+    sweep = ("max_leaf_nodes", cross_validate_leaf_nodes)
+    grid_search = search(
+        model,
+        param_grid,
+        X_train,
+        y_train,
+        cv=cv,
+        pool=pool,
+        cost=tree_cost,
+        min_rows=tree_rows,
+        sweep=sweep if search_config.pop("sweep", True) else None,
+        store=store,
+        verbose=2,
+        **search_config,
+    )
     best_params = grid_search.best_params_
 
     print("====================Best Decision Tree Hyperparameters==================")
@@ -44,40 +135,67 @@ def tune_decision_tree(
 
 
 def tune_polynomial_linear_regression(
-    X_train: pd.DataFrame, y_train: pd.Series, param_grid: dict
-) -> GridSearchCV:
-    """Tune PolynomialFeatures and LinearRegression using GridSearchCV.
+    X_train: np.ndarray,
+    y_train: np.ndarray,
+    param_grid: dict,
+    search_config: dict = None,
+    pool: TaskPool = None,
+    store: TrialStore = None,
+    cv=5,
+) -> SearchResult:
+    """Tune PolynomialFeatures and LinearRegression with cross validation.
 
     Parameters:
     -----------
-    X_train: pd.DataFrame
+    X_train: np.ndarray
 
-    y_train: pd.Series
+    y_train: np.ndarray
 
     param_grid: dict
 
+    search_config: dict
+        Search strategy and its options, see search.search
+
+    pool: TaskPool
+        Worker processes or a WorkQueue, shared with the other search
+
+    store: TrialStore
+        Finished fits, skipped when run again
+
+    cv: int or list
+        Number of folds, or the (train, test) folds of the split
+
     Returns:
     --------
-    GridSearchCV
+    SearchResult
     """
-    # Create pipeline with both transformers
-    pipeline = Pipeline(
-        [("poly", PolynomialFeatures()), ("linear", LinearRegression())]
-    )
-
     # Adjust parameter grid to use poly__ prefix
     poly_param_grid = {f"poly__{key}": value for key, value in param_grid.items()}
 
-    # Perform grid search
-    grid_search = GridSearchCV(
-        pipeline,
+    poly_param_grid.setdefault("poly__degree", [2])
+    search_config = dict(search_config or {})
+
+    # The model evaluate.py ships. All degrees of an interaction_only value
+    # are scored from the normal equations of the highest degree, one fit
+    # per fold, with the same scores as refitting the pipeline
+    sweep = ("poly__degree", cross_validate_degrees)
+
+    # Perform the search
+    grid_search = search(
+        polynomial_regression(),
         poly_param_grid,
-        cv=5,
-        n_jobs=-1,
-        verbose=2,
+        X_train,
+        y_train,
+        cv=cv,
         scoring="neg_mean_squared_error",
+        pool=pool,
+        cost=lambda params, n_rows: poly_cost(params, n_rows, X_train.shape[1]),
+        min_rows=lambda params: poly_terms(params, X_train.shape[1]),
+        sweep=sweep if search_config.pop("sweep", True) else None,
+        store=store,
+        verbose=2,
+        **search_config,
     )
-    grid_search.fit(X_train, y_train)
     best_params = grid_search.best_params_
 
     print(
@@ -95,18 +213,57 @@ def tune_polynomial_linear_regression(
     return grid_search
 
 
-def get_hp_tuning_results(grid_search: GridSearchCV, model_name: str = "") -> str:
-    """Get the results of hyperparameter tuning in a Markdown table with regression metrics
+def tree_cost(params: dict, n_rows: int) -> float:
+    """Relative time of one tree fit, absolute_error splits are quadratic."""
+    if params.get("criterion") == "absolute_error":
+        return float(n_rows) ** 2
+    return n_rows * math.log2(max(n_rows, 2))
+
+
+def tree_rows(params: dict) -> int:
+    """Training rows a tree needs before its leaf budget, not its leaf size, shapes it.
+
+    On max_leaf_nodes x min_samples_leaf rows every leaf has exactly
+    min_samples_leaf rows and the splits are forced, twice that leaves
+    room to choose them.
+    """
+    leaves = params.get("max_leaf_nodes") or 2
+    leaf_rows = params.get("min_samples_leaf", 1)
+    if not isinstance(leaf_rows, int):
+        # a fraction of the rows grows the same tree on any subsample
+        leaf_rows = 1
+    return 2 * leaves * leaf_rows
+
+
+def poly_cost(params: dict, n_rows: int, n_features: int) -> float:
+    """Relative time of one polynomial fit, rows x expanded features squared."""
+    return float(n_rows) * poly_terms(params, n_features) ** 2
+
+
+def poly_terms(params: dict, n_features: int) -> int:
+    """Number of PolynomialFeatures columns, bias included."""
+    degree = params.get("poly__degree", 2)
+    if params.get("poly__interaction_only", False):
+        return sum(math.comb(n_features, k) for k in range(degree + 1))
+    return math.comb(n_features + degree, degree)
+
+
+def get_hp_tuning_table(grid_search: SearchResult) -> pd.DataFrame:
+    """Get the results of hyperparameter tuning with regression metrics and costs
+
+    Besides the scores, every candidate gets its mean fit and score time
+    per fold and its peak RSS. Pareto marks the candidates cross
+    validated on all rows and folds, with costs of their own, that no
+    other such candidate beats on both Mean MSE and fit + score time.
+    Swept candidates share the costs of one fit and are left out.
 
     Parameters:
     -----------
-    grid_search: GridSearchCV
-
-    model_name: str
+    grid_search: SearchResult
 
     Returns:
     --------
-    str
+    pd.DataFrame
 
     """
     # Get CV results
@@ -125,56 +282,172 @@ def get_hp_tuning_results(grid_search: GridSearchCV, model_name: str = "") -> st
             "Mean MSE": mean_mse.round(4),
             "Std MSE": std_mse.round(4),
             "Mean RMSE": mean_rmse.round(4),
+            "Fit time (s)": cv_results["mean_fit_time"].round(4),
+            "Score time (s)": cv_results["mean_score_time"].round(4),
+            "Peak RSS (MiB)": (cv_results["peak_rss"] / 2**20).round(1),
             **params_df,
         }
     )
+    complete = pd.Series(True, index=cv_results.index)
+    if "iter" in cv_results:
+        # successive halving: the rung each candidate reached
+        results["Rung"] = cv_results["iter"]
+        results["Rows"] = cv_results["n_resources"]
+        complete &= cv_results["iter"] == cv_results["iter"].max()
+    if "pruned" in cv_results:
+        # racing: scored on the folds run before the candidate was pruned
+        n_folds = cv_results.filter(regex=r"^split\d+_test_score$").notna().sum(axis=1)
+        results["Pruned"] = np.where(
+            cv_results["pruned"], "after " + n_folds.astype(str) + " folds", ""
+        )
+        complete &= ~cv_results["pruned"].astype(bool)
+    if "swept" in cv_results:
+        # sweeps: the fit time and peak RSS of a fit shared with others
+        results["Swept"] = cv_results["swept"].astype(bool)
+        complete &= ~results["Swept"]
+
+    # Accuracy against training and serving cost
+    cost = cv_results["mean_fit_time"] + cv_results["mean_score_time"]
+    results["Pareto"] = [
+        bool(complete[c])
+        and not (
+            complete
+            & (mean_mse <= mean_mse[c])
+            & (cost <= cost[c])
+            & ((mean_mse < mean_mse[c]) | (cost < cost[c]))
+        ).any()
+        for c in cv_results.index
+    ]
+
+    # Sort
+    results.sort_values(["Rank", "Mean MSE"], ascending=True, inplace=True)
+    return results
+
+
+def get_hp_tuning_results(grid_search: SearchResult, model_name: str = "") -> str:
+    """Get the results of hyperparameter tuning in a Markdown table with regression metrics
+
+    The table is followed by the Pareto front of accuracy against cost,
+    cheapest first.
+
+    Parameters:
+    -----------
+    grid_search: SearchResult
 
-    # Sort and format
-    results.sort_values("Mean MSE", ascending=True, inplace=True)
+    model_name: str
+
+    Returns:
+    --------
+    str
+
+    """
+    results = get_hp_tuning_table(grid_search)
 
     # Generate markdown output only the results
     markdown = results.to_markdown(index=False)
-    
+
+    pareto = results[results["Pareto"]].drop(columns="Pareto")
+    pareto = pareto.sort_values(["Fit time (s)", "Score time (s)"])
+    markdown += "\n\nPareto front, Mean MSE against fit + score time:\n\n"
+    if pareto.empty:
+        markdown += 'No candidate has costs of its own, run with "sweep": false.'
+    else:
+        markdown += pareto.to_markdown(index=False)
+
     return markdown
 
 
 def main():
-    # Load the data
-    X_train = pd.read_parquet("data/transform/validation/X_train.parquet")
-    X_test = pd.read_parquet("data/transform/validation/X_test.parquet")
-    y_train = pd.read_parquet("data/transform/validation/y_train.parquet")
-    y_test = pd.read_parquet("data/transform/validation/y_test.parquet")
-    X_val = pd.read_parquet("data/transform/validation/X_val.parquet")
-    y_val = pd.read_parquet("data/transform/validation/y_val.parquet")
-
     # Load hyperparameter configurations
     with open("hp_config.json", "r") as config_file:
         hp_config = json.load(config_file)
 
-    # Hyperparameter tuning for DecisionTreeRegressor
-    print("Starting hyperparameter tuning for DecisionTreeRegressor...")
-    dt_param_grid = hp_config.get("DecisionTreeRegressor", {})
-    dt_grid_search = tune_decision_tree(X_train, y_train, dt_param_grid)
+    # Load the training data, the only split the searches use.
+    # An optional "features" list in hp_config.json limits the columns read.
+    # A kfold index split brings its own folds, the searches cross validate
+    # on the folds of the train rows instead of a 5-fold KFold.
+    cv = 5
+    if has_index_splits("data/transform/validation"):
+        X_train, y_train = load_split("data/transform/validation", "train")
+        if hp_config.get("features"):
+            X_train = X_train[hp_config["features"]]
+        cv = load_cv_folds("data/transform/validation", "train") or cv
+    else:
+        X_train = read_parquet(
+            "data/transform/validation/X_train.parquet",
+            columns=hp_config.get("features"),
+        )
+        y_train = read_parquet("data/transform/validation/y_train.parquet")
+
+    # One contiguous float copy of the training data, saved once for the
+    # workers, which memory map it read-only
+    X_train, y_train = as_arrays(X_train, y_train)
 
-    # Hyperparameter tuning for PolynomialFeatures + LinearRegression
-    print("Starting hyperparameter tuning for PolynomialFeatures + LinearRegression...")
+    dt_param_grid = hp_config.get("DecisionTreeRegressor", {})
     poly_param_grid = hp_config.get("PolynomialFeatures", {})
-    poly_grid_search = tune_polynomial_linear_regression(
-        X_train, y_train, poly_param_grid
-    )
-
-    # Save tuning results as markdown
+    search_config = hp_config.get("search", {})
+    resources = hp_config.get("resources", {})
+
+    # Both searches share one pool of workers under the CPU budget, or one
+    # work queue served by workers on any host, and one store of finished fits
+    if resources.get("queue"):
+        pool = WorkQueue(
+            resources["queue"],
+            resources.get("local_workers", 0),
+            resources.get("blas_threads", 1),
+        )
+    else:
+        pool = TaskPool(resources.get("cpus"), resources.get("blas_threads", 1))
+    # the store closes last, after the pool has saved its last results
+    with TrialStore() as store, pool, ThreadPoolExecutor(max_workers=2) as searches:
+        # Hyperparameter tuning for DecisionTreeRegressor
+        print("Starting hyperparameter tuning for DecisionTreeRegressor...")
+        dt_future = searches.submit(
+            tune_decision_tree,
+            X_train,
+            y_train,
+            dt_param_grid,
+            search_config,
+            pool,
+            store,
+            cv,
+        )
+
+        # Hyperparameter tuning for PolynomialFeatures + LinearRegression
+        print(
+            "Starting hyperparameter tuning for PolynomialFeatures + LinearRegression..."
+        )
+        poly_future = searches.submit(
+            tune_polynomial_linear_regression,
+            X_train,
+            y_train,
+            poly_param_grid,
+            search_config,
+            pool,
+            store,
+            cv,
+        )
+        dt_grid_search = dt_future.result()
+        poly_grid_search = poly_future.result()
+
+    # Save tuning results as markdown, and as parquet for analysis
     dt_markdown = get_hp_tuning_results(
         dt_grid_search, model_name="DecisionTreeRegressor"
     )
     with open("model_output/hp_tuning_results_decision_tree.md", "w") as dt_md_file:
         dt_md_file.write(dt_markdown)
+    get_hp_tuning_table(dt_grid_search).to_parquet(
+        "model_output/hp_tuning_results_decision_tree.parquet", index=False
+    )
 
     poly_markdown = get_hp_tuning_results(
         poly_grid_search, model_name="PolynomialFeatures + LinearRegression"
     )
     with open("model_output/hp_tuning_results_poly_linear.md", "w") as poly_md_file:
         poly_md_file.write(poly_markdown)
+    get_hp_tuning_table(poly_grid_search).to_parquet(
+        "model_output/hp_tuning_results_poly_linear.parquet", index=False
+    )
 
     # Save the best hyperparameters for DecisionTreeRegressor and PolynomialFeatures + LinearRegression
     dt_best_params = dt_grid_search.best_params_
@@ -0,0 +1,367 @@
+"""Reading and writing the parquet datasets of the workflow.
+
+Writing supports hive partitioning (e.g. by region), row group size,
+compression codec and level, dictionary encoding and column statistics.
+Reading pushes column selections and filters down to pyarrow, which
+skips partitions and row groups whose statistics rule them out.
+
+Functions:
+----------
+write_options: Collect the parquet writer options.
+parse_filter: Turn "region == 1" into a pyarrow filter.
+read_parquet: Read a parquet file or dataset with pushdown.
+iter_parquet: Read a parquet file or dataset in batches with pushdown.
+footer_summary: Summary statistics from the parquet footers.
+
+How to use:
+-----------
+>>> options = write_options(partition_by=["region"], row_group_size=100_000)
+>>> data.to_parquet("data/transform/insurance_000.parquet", **options)
+>>> read_parquet(
+...     "data/transform/insurance_000.parquet",
+...     columns=["age", "charges"],
+...     filters=[parse_filter("region == 1")],
+... )
+"""
+
+import re
+import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pandas as pd
+
+# Statistics footer_summary can answer without reading column data
+footer_stats = ["count", "missing", "min", "max"]
+
+
+def write_options(
+    partition_by: list = None,
+    row_group_size: int = None,
+    compression: str = "snappy",
+    compression_level: int = None,
+    use_dictionary: bool = True,
+    write_statistics: bool = True,
+) -> dict:
+    """Collect the parquet writer options.
+
+    The result can be passed to DataFrame.to_parquet as keyword arguments.
+
+    Parameters
+    ----------
+    partition_by: list :
+        Columns to hive partition the dataset by. (Default value = None)
+
+    row_group_size: int :
+        Maximum number of rows per row group. Smaller row groups let
+        filters skip more data. (Default value = None, pyarrow default)
+
+    compression: str :
+        Compression codec, e.g. snappy, zstd, gzip or none.
+        (Default value = "snappy")
+
+    compression_level: int :
+        Codec specific compression level. (Default value = None)
+
+    use_dictionary: bool :
+        Dictionary encode the columns. (Default value = True)
+
+    write_statistics: bool :
+        Write min/max statistics used to skip row groups.
+        (Default value = True)
+
+    Returns
+    -------
+    dict
+        The writer options.
+
+    Examples
+    --------
+    >>> write_options(partition_by=["region"], compression="zstd")
+
+    """
+    options = {
+        "compression": None if compression == "none" else compression,
+        "use_dictionary": use_dictionary,
+        "write_statistics": write_statistics,
+    }
+    if partition_by:
+        options["partition_cols"] = list(partition_by)
+    if row_group_size:
+        options["row_group_size"] = row_group_size
+    if compression_level is not None:
+        options["compression_level"] = compression_level
+    return options
+
+
+def parse_filter(expression: str) -> tuple:
+    """Turn a comparison such as "region == 1" into a pyarrow filter.
+
+    Parameters
+    ----------
+    expression: str :
+        "<column> <op> <value>" with op one of ==, !=, <, <=, >, >=.
+        The value is read as JSON, so strings need double quotes.
+
+    Returns
+    -------
+    tuple
+        (column, op, value) as accepted by read_parquet.
+
+    Examples
+    --------
+    >>> parse_filter("age >= 40")
+    ('age', '>=', 40)
+
+    """
+    match = re.fullmatch(r"\s*(\w+)\s*(==|!=|<=|>=|<|>)\s*(.+?)\s*", expression)
+    if match is None:
+        raise ValueError(
+            f"Cannot parse filter {expression!r}, expected 'column op value'"
+        )
+    column, op, value = match.groups()
+    return column, op, json.loads(value)
+
+
+def read_parquet(path: str, columns: list = None, filters: list = None) -> pd.DataFrame:
+    """Read a parquet file or dataset with column and filter pushdown.
+
+    Partition columns come back with the dtype and at the position they
+    had when the data was written, rather than as categoricals appended
+    after the other columns, so a partitioned dataset reads the same as
+    an unpartitioned file.
+
+    Parameters
+    ----------
+    path: str :
+        Parquet file or dataset directory.
+
+    columns: list :
+        Columns to read. (Default value = None, all columns)
+
+    filters: list :
+        (column, op, value) tuples that all have to hold, see parse_filter.
+        (Default value = None)
+
+    Returns
+    -------
+    pd.DataFrame
+        The data.
+
+    Examples
+    --------
+    >>> read_parquet("data/transform/insurance_000.parquet", columns=["age"])
+
+    """
+    table = pq.read_table(
+        path, columns=columns, filters=filters or None, partitioning="hive"
+    )
+    return _restore_partitions(table, columns, table.schema.metadata).to_pandas()
+
+
+def iter_parquet(
+    path: str, columns: list = None, filters: list = None, batch_size: int = 1_000_000
+):
+    """Read a parquet file or dataset in batches with column and filter pushdown.
+
+    Only one batch is in memory at a time.
+
+    Parameters
+    ----------
+    path: str :
+        Parquet file or dataset directory.
+
+    columns: list :
+        Columns to read. (Default value = None, all columns)
+
+    filters: list :
+        (column, op, value) tuples that all have to hold, see parse_filter.
+        (Default value = None)
+
+    batch_size: int :
+        Maximum rows per batch. (Default value = 1_000_000)
+
+    Yields
+    ------
+    pd.DataFrame
+        The data, batch by batch.
+
+    Examples
+    --------
+    >>> for chunk in iter_parquet("data/transform/insurance_000.parquet"):
+    ...     print(len(chunk))
+
+    """
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    scanner = dataset.scanner(
+        columns=columns,
+        filter=pq.filters_to_expression(filters) if filters else None,
+        batch_size=batch_size,
+    )
+    metadata = dataset.schema.metadata
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            table = pa.Table.from_batches([batch])
+            yield _restore_partitions(table, columns, metadata).to_pandas()
+
+
+def _restore_partitions(table: pa.Table, columns: list, metadata: dict) -> pa.Table:
+    """Partition columns back in their written dtype and column position.
+
+    Hive partitioning turns partition columns into dictionaries appended
+    at the end. The pandas metadata that to_parquet stores in every file
+    still holds the original dtypes and column order.
+    """
+    written = []
+    if metadata and b"pandas" in metadata:
+        written = json.loads(metadata[b"pandas"])["columns"]
+    numpy_types = {column["name"]: column["numpy_type"] for column in written}
+    for index, field in enumerate(table.schema):
+        # partitions read as dictionaries, or as int32 through datasets
+        dictionary = pa.types.is_dictionary(field.type)
+        if not (dictionary or pa.types.is_integer(field.type)):
+            continue
+        value_type = field.type.value_type if dictionary else field.type
+        numpy_type = numpy_types.get(field.name)
+        if numpy_type == "category" or (numpy_type is None and not dictionary):
+            continue
+        if numpy_type not in (None, "object"):
+            try:
+                value_type = pa.from_numpy_dtype(np.dtype(numpy_type))
+            except TypeError:
+                # pandas extension dtypes such as Int64 round trip already
+                continue
+        elif not (pa.types.is_integer(value_type) or numpy_type == "object"):
+            continue
+        if field.type != value_type:
+            values = table[field.name]
+            if dictionary:
+                values = pc.cast(values, field.type.value_type)
+            table = table.set_column(index, field.name, pc.cast(values, value_type))
+    order = columns or [column["name"] for column in written]
+    names = [name for name in order if name in table.column_names]
+    names += [name for name in table.column_names if name not in names]
+    return table.select(names)
+
+
+def footer_summary(path: str, columns: list = None, stats: list = None) -> pd.DataFrame:
+    """Summary statistics from the parquet footers.
+
+    Row counts, null counts and min/max per row group are stored in
+    the footer of every parquet file, so count, missing, min and max
+    need no column data at all. Partition columns are answered from
+    the directory names. Only the other statistics (mean, std and
+    quantiles such as 50%), or columns written without statistics,
+    read column data, and only for the requested columns.
+
+    Parameters
+    ----------
+    path: str :
+        Parquet file or dataset directory.
+
+    columns: list :
+        Columns to summarize. (Default value = None, all columns)
+
+    stats: list :
+        Statistics to compute: count, missing, min, max, mean, std
+        and quantiles like 25%. (Default value = None, the footer stats)
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per statistic, one column per data column.
+
+    Examples
+    --------
+    >>> footer_summary("data/transform/insurance_000.parquet")
+    >>> footer_summary("data/transform/insurance_000.parquet", ["bmi"], ["mean", "50%"])
+
+    """
+    stats = stats or footer_stats
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    columns = columns or dataset.schema.names
+    totals = {
+        column: {"count": 0, "missing": 0, "min": None, "max": None}
+        for column in columns
+    }
+    unknown = set()
+    for fragment in dataset.get_fragments():
+        metadata = fragment.metadata
+        partition = ds.get_partition_keys(fragment.partition_expression)
+        for column in columns:
+            if column in partition:
+                chunks = [(metadata.num_rows, 0, partition[column], partition[column])]
+            else:
+                chunks = _row_group_stats(metadata, column)
+            if chunks is None:
+                unknown.add(column)
+                continue
+            total = totals[column]
+            for count, missing, low, high in chunks:
+                total["count"] += count
+                total["missing"] += missing
+                if low is not None:
+                    total["min"] = (
+                        low if total["min"] is None else min(total["min"], low)
+                    )
+                    total["max"] = (
+                        high if total["max"] is None else max(total["max"], high)
+                    )
+
+    # everything the footers cannot answer is read, for those columns only
+    data_stats = [stat for stat in stats if stat not in footer_stats]
+    to_read = columns if data_stats else sorted(unknown, key=columns.index)
+    data = dataset.to_table(columns=list(to_read)).to_pandas() if to_read else None
+
+    result = {}
+    for column in columns:
+        if column in unknown:
+            values = data[column]
+            total = {
+                "count": int(values.count()),
+                "missing": int(values.isna().sum()),
+                "min": values.min(),
+                "max": values.max(),
+            }
+        else:
+            total = totals[column]
+            total["count"] -= total["missing"]
+        for stat in data_stats:
+            values = data[column]
+            if stat == "mean":
+                total[stat] = values.mean()
+            elif stat == "std":
+                total[stat] = values.std()
+            elif stat.endswith("%"):
+                total[stat] = values.quantile(float(stat[:-1]) / 100)
+            else:
+                raise ValueError(f"Unknown statistic {stat!r}")
+        result[column] = {stat: total[stat] for stat in stats}
+    return pd.DataFrame(result, columns=columns)
+
+
+def _row_group_stats(metadata: pq.FileMetaData, column: str):
+    """(count, missing, min, max) per row group, None without statistics."""
+    index = None
+    for i in range(metadata.num_columns):
+        if metadata.schema.column(i).path == column:
+            index = i
+    if index is None:
+        return None
+    chunks = []
+    for group in range(metadata.num_row_groups):
+        row_group = metadata.row_group(group)
+        statistics = row_group.column(index).statistics
+        if statistics is None or not statistics.has_null_count:
+            return None
+        missing = statistics.null_count
+        if statistics.has_min_max:
+            low, high = statistics.min, statistics.max
+        elif missing == row_group.num_rows:
+            low = high = None
+        else:
+            return None
+        chunks.append((row_group.num_rows, missing, low, high))
+    return chunks
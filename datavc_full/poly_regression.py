@@ -0,0 +1,366 @@
+"""Exact cross validation of (polynomial) linear regression from sufficient statistics.
+
+The least squares fit of a fold only needs the normal equations of its
+training rows, (X^T X, X^T y), and its test MSE only needs the same
+statistics of its test rows plus y^T y. With KFold the training rows
+of a fold are all other rows, so one streaming pass accumulates the
+statistics of every fold, and the training statistics of a fold are
+the totals minus its own. K folds cost one pass instead of K refits.
+
+PolynomialFeatures orders its columns by degree, so the features of
+degree d are the first columns of the features of degree d + 1 and
+their normal equations are the leading block of the larger ones. A
+sweep over degrees 2, 3 and 4 costs little more than the degree 4
+statistics alone. Plain and scaled LinearRegression are degree 1.
+
+The raw features are standardized before the expansion. A polynomial
+of standardized features spans the same functions as one of the raw
+features, but the normal equations are far better conditioned. They
+are solved with a symmetric eigendecomposition of the scaled Gram
+matrix, dropping the directions of dependent monomials (x^2 is a
+multiple of x and the bias for a binary x).
+
+LinearRegression on the raw PolynomialFeatures does not drop them, and
+with the binary sex and smoker columns its least squares solver can
+return a fit with a far higher cross validated MSE. The model these
+statistics describe is polynomial_regression, StandardScaler +
+PolynomialFeatures + MinimumNormRegression, the model hp_tuning tunes
+and evaluate.py ships.
+
+Classes:
+--------
+MinimumNormRegression: Least squares with the solver of the cross validation.
+
+Functions:
+----------
+polynomial_regression: The polynomial model the cross validation scores.
+polynomial_blocks: The PolynomialFeatures columns, one degree at a time.
+fold_statistics: Normal equations, y^T y and rows of every fold, in one pass.
+cross_validate_linear: Test MSE of every degree on every fold.
+cross_validate_degrees: The search sweep function for poly__degree.
+
+How to use:
+-----------
+>>> model = polynomial_regression(degree=3).fit(X_train, y_train)
+>>> mse, fit_times, score_times = cross_validate_linear(X, y, folds, degrees=[1, 2])
+>>> scores, fit_times, score_times = cross_validate_degrees(
+...     polynomial_regression(), {"poly__interaction_only": False}, [2, 3, 4], X, y, folds
+... )
+"""
+
+import time
+from itertools import combinations, combinations_with_replacement
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+
+
+class MinimumNormRegression(RegressorMixin, BaseEstimator):
+    """Least squares with the solver of the cross validation.
+
+    Like LinearRegression on features holding a bias column, e.g. those
+    of PolynomialFeatures, but solved from the normal equations of the
+    centered target by _solve, so dependent columns are dropped exactly
+    as in cross_validate_linear.
+    """
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64).ravel()
+        self.intercept_ = y.mean()
+        self.coef_ = _solve(X.T @ X, X.T @ (y - self.intercept_))
+        return self
+
+    def predict(self, X):
+        return np.asarray(X, dtype=np.float64) @ self.coef_ + self.intercept_
+
+
+def polynomial_regression(degree: int = 2, interaction_only: bool = False) -> Pipeline:
+    """The polynomial model whose cross validated MSE cross_validate_linear computes.
+
+    Parameters
+    ----------
+    degree: int :
+        The polynomial degree. (Default value = 2)
+
+    interaction_only: bool :
+        Only products of distinct features. (Default value = False)
+
+    Returns
+    -------
+    Pipeline
+        StandardScaler, PolynomialFeatures and MinimumNormRegression,
+        with the poly__degree and poly__interaction_only parameters.
+
+    Examples
+    --------
+    >>> model = polynomial_regression(degree=3).fit(X_train, y_train)
+
+    """
+    return Pipeline(
+        [
+            ("scale", StandardScaler()),
+            ("poly", PolynomialFeatures(degree, interaction_only=interaction_only)),
+            ("linear", MinimumNormRegression()),
+        ]
+    )
+
+
+def polynomial_blocks(X: np.ndarray, max_degree: int, interaction_only: bool = False):
+    """The PolynomialFeatures columns of X, one block per degree.
+
+    Parameters
+    ----------
+    X: np.ndarray :
+        The features.
+
+    max_degree: int :
+        The highest degree.
+
+    interaction_only: bool :
+        Only products of distinct features. (Default value = False)
+
+    Yields
+    ------
+    np.ndarray
+        The monomials of degree 0 (the bias column), 1, ... max_degree,
+        in the column order of PolynomialFeatures.
+
+    Examples
+    --------
+    >>> np.hstack(list(polynomial_blocks(X, 3)))
+
+    """
+    n_features = X.shape[1]
+    terms = combinations if interaction_only else combinations_with_replacement
+    block = np.ones((X.shape[0], 1))
+    index = {(): 0}
+    yield block
+    for degree in range(1, max_degree + 1):
+        monomials = list(terms(range(n_features), degree))
+        if not monomials:
+            break
+        # every monomial is a monomial of the previous degree times a feature
+        lower = [index[monomial[:-1]] for monomial in monomials]
+        feature = [monomial[-1] for monomial in monomials]
+        block = block[:, lower] * X[:, feature]
+        index = {monomial: i for i, monomial in enumerate(monomials)}
+        yield block
+
+
+def fold_statistics(
+    X: np.ndarray,
+    y: np.ndarray,
+    fold: np.ndarray,
+    n_folds: int,
+    degree: int = 1,
+    interaction_only: bool = False,
+    batch_size: int = 65536,
+) -> tuple:
+    """Normal equations, y^T y and row count of every fold, in one pass.
+
+    Parameters
+    ----------
+    X: np.ndarray :
+        The (standardized) features.
+
+    y: np.ndarray :
+        The target.
+
+    fold: np.ndarray :
+        Test fold of every row, -1 for rows only used for training and
+        -2 for rows not used.
+
+    n_folds: int :
+        Number of folds.
+
+    degree: int :
+        Polynomial degree of the features. (Default value = 1)
+
+    interaction_only: bool :
+        Only products of distinct features. (Default value = False)
+
+    batch_size: int :
+        Rows expanded at a time. (Default value = 65536)
+
+    Returns
+    -------
+    tuple
+        (gram, xty, yy, count) with shapes (n_folds + 1, p, p),
+        (n_folds + 1, p), (n_folds + 1,) and (n_folds + 1,). The last
+        entry holds the totals over all used rows.
+
+    Examples
+    --------
+    >>> gram, xty, yy, count = fold_statistics(X, y, fold, 5, degree=3)
+
+    """
+    gram = xty = None
+    yy = np.zeros(n_folds + 1)
+    count = np.zeros(n_folds + 1)
+    for start in range(0, len(y), batch_size):
+        rows = slice(start, start + batch_size)
+        features = np.hstack(list(polynomial_blocks(X[rows], degree, interaction_only)))
+        target, ids = y[rows], fold[rows]
+        if gram is None:
+            n_columns = features.shape[1]
+            gram = np.zeros((n_folds + 1, n_columns, n_columns))
+            xty = np.zeros((n_folds + 1, n_columns))
+        for k in range(n_folds):
+            selected = ids == k
+            gram[k] += features[selected].T @ features[selected]
+            xty[k] += features[selected].T @ target[selected]
+            yy[k] += target[selected] @ target[selected]
+            count[k] += np.count_nonzero(selected)
+        used = ids >= -1
+        if not used.all():
+            features, target = features[used], target[used]
+        gram[-1] += features.T @ features
+        xty[-1] += features.T @ target
+        yy[-1] += target @ target
+        count[-1] += len(target)
+    return gram, xty, yy, count
+
+
+def cross_validate_linear(
+    X,
+    y,
+    folds: list,
+    degrees: list = (1,),
+    interaction_only: bool = False,
+    batch_size: int = 65536,
+) -> tuple:
+    """Test MSE of (polynomial) linear regression for every degree and fold.
+
+    Exact: the same MSE as refitting polynomial_regression on every fold,
+    up to rounding. Degree 1 is also LinearRegression on the raw or
+    scaled features. The training and test rows of every fold must be
+    the same rows, as with KFold. Rows outside those of the first fold
+    are not used, e.g. the repeated rows of the layout search hands the
+    tasks.
+
+    Parameters
+    ----------
+    X :
+        The features.
+
+    y :
+        The target.
+
+    folds: list :
+        (train rows, test rows) of every fold.
+
+    degrees: list :
+        Polynomial degrees, 1 for LinearRegression on the raw or scaled
+        features. (Default value = (1,))
+
+    interaction_only: bool :
+        Only products of distinct features. (Default value = False)
+
+    batch_size: int :
+        Rows expanded at a time. (Default value = 65536)
+
+    Returns
+    -------
+    tuple
+        (mse, fit times, score times), arrays of shape
+        (len(degrees), len(folds)). The pass over the data is shared
+        equally by the folds.
+
+    Examples
+    --------
+    >>> mse, _, _ = cross_validate_linear(X_train, y_train, KFold(5).split(X_train))
+
+    """
+    start = time.perf_counter()
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64).ravel()
+    folds = list(folds)
+    fold = np.full(len(y), -2, dtype=np.int32)
+    fold[folds[0][0]] = -1
+    for k, (_, test) in enumerate(folds):
+        fold[test] = k
+    # any fixed affine map spans the same polynomials, use the first rows
+    first = X[:batch_size]
+    scale = first.std(axis=0)
+    scale[scale == 0] = 1.0
+    X = (X - first.mean(axis=0)) / scale
+    y = y - y[:batch_size].mean()
+    gram, xty, yy, count = fold_statistics(
+        X, y, fold, len(folds), max(degrees), interaction_only, batch_size
+    )
+    passed = (time.perf_counter() - start) / len(folds)
+
+    n_features = X.shape[1]
+    terms = combinations if interaction_only else combinations_with_replacement
+    shape = (len(degrees), len(folds))
+    mse, fit_times, score_times = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    for i, degree in enumerate(degrees):
+        # columns of the degree, a leading block of the statistics
+        p = sum(len(list(terms(range(n_features), d))) for d in range(degree + 1))
+        for k in range(len(folds)):
+            start = time.perf_counter()
+            # downdate the totals by the test fold
+            coef = _solve(gram[-1, :p, :p] - gram[k, :p, :p], xty[-1, :p] - xty[k, :p])
+            fitted = time.perf_counter()
+            error = yy[k] - 2 * coef @ xty[k, :p] + coef @ gram[k, :p, :p] @ coef
+            mse[i, k] = error / count[k]
+            fit_times[i, k] = passed + fitted - start
+            score_times[i, k] = time.perf_counter() - fitted
+    return mse, fit_times, score_times
+
+
+def cross_validate_degrees(
+    estimator, params: dict, degrees: list, X, y, folds: list
+) -> tuple:
+    """Negative MSE of polynomial_regression for every degree.
+
+    The search sweep function for poly__degree, see search.search.
+
+    Parameters
+    ----------
+    estimator :
+        The polynomial_regression pipeline of the search.
+
+    params: dict :
+        The other parameters of the candidates, poly__interaction_only.
+
+    degrees: list :
+        The poly__degree values.
+
+    X :
+        The features.
+
+    y :
+        The target.
+
+    folds: list :
+        (train rows, test rows) of every fold.
+
+    Returns
+    -------
+    tuple
+        (scores, fit times, score times), arrays of shape
+        (len(degrees), len(folds)).
+
+    Examples
+    --------
+    >>> cross_validate_degrees(polynomial_regression(), {}, [2, 3, 4], X, y, folds)
+
+    """
+    mse, fit_times, score_times = cross_validate_linear(
+        X, y, folds, degrees, params.get("poly__interaction_only", False)
+    )
+    return -mse, fit_times, score_times
+
+
+def _solve(gram: np.ndarray, xty: np.ndarray) -> np.ndarray:
+    """Minimum norm solution of the normal equations in scaled coordinates."""
+    scale = np.sqrt(np.diag(gram))
+    scale[scale == 0] = 1.0
+    values, vectors = np.linalg.eigh(gram / np.outer(scale, scale))
+    # directions below rounding error of the Gram matrix are dependent columns
+    keep = values > values[-1] * len(values) * np.finfo(np.float64).eps
+    vectors = vectors[:, keep]
+    return vectors @ ((vectors.T @ (xty / scale)) / values[keep]) / scale
@@ -0,0 +1,833 @@
+"""Hyperparameter search strategies for hp_tuning.
+
+- grid: every combination of the parameter grid, like GridSearchCV.
+- random: n_iter combinations sampled from the grid.
+- halving: successive halving over the number of training rows. All
+  candidates are cross validated on a small subsample, the best
+  1 / factor of them move on to a factor times larger subsample, and
+  only the last few candidates are cross validated on all rows.
+
+Every strategy uses the same unshuffled KFold as GridSearchCV with an
+integer cv, so a candidate cross validated on all rows gets exactly the
+GridSearchCV scores. cv can also be a list of (train, test) row numbers,
+e.g. the fold ids of an index based split (see splits.py).
+
+A sweep function can score all values of one parameter from a single
+fit, e.g. every polynomial degree from the normal equations of the
+highest degree (see poly_regression.py). Candidates differing only in
+that parameter are then cross validated by one task.
+
+With racing, the first three folds run at once and the others one at
+a time. After each, a candidate is pruned once a one-sided paired
+t-test on its completed folds says it is worse than the current best
+candidate. Halving only races on its last rung, on all rows. Pruned
+candidates keep the scores of the folds they ran and rank last.
+
+The candidates of one sweep share its fit, so they all report its fit
+time and peak RSS. They are marked as swept in cv_results_, their costs
+are not their own.
+
+Finished fits can be saved in a TrialStore (see trials.py), so a
+search run again on the same data skips the fits it already did.
+
+The candidate x fold fits run in a TaskPool. Several searches can share
+one pool from different threads, so they run concurrently under one CPU
+budget. The pool starts the most expensive waiting fit first and caps
+the BLAS threads of every worker, so workers x BLAS threads never
+exceeds the budget. Shared data is saved once as .npy files that every
+worker maps read-only, so worker memory does not grow with the number
+of workers; as_arrays converts the training data to contiguous float
+arrays first. With KFold-like folds the rows are saved ordered by fold
+and repeated up to the last one, so the training and test rows of
+every fold are contiguous slices and the tasks fit and score views
+instead of copying their rows. Every task measures its fit and score times and
+the peak RSS of its worker, reported per candidate in cv_results_.
+
+Classes:
+--------
+TaskPool: Worker processes shared by searches, longest tasks first.
+SearchResult: The cross validation results of a search.
+
+Functions:
+----------
+as_arrays: The training data as contiguous float arrays.
+save_shared: Save arrays for the workers, returns the key to pass.
+search: Run a search strategy, returns a SearchResult.
+
+How to use:
+-----------
+>>> X, y = as_arrays(X_train, y_train)
+>>> result = search(DecisionTreeRegressor(), {"max_leaf_nodes": [4, 8]}, X, y)
+>>> with TaskPool(cpus=8, blas_threads=1) as pool:
+...     result = search(model, param_grid, X, y, strategy="halving", pool=pool)
+>>> result.best_params_
+"""
+
+import os
+import sys
+import math
+import time
+import heapq
+import hashlib
+import resource
+import shutil
+import tempfile
+import threading
+from functools import partial
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import stats
+from threadpoolctl import threadpool_limits
+from trials import TrialStore
+from sklearn.base import clone
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import KFold, ParameterGrid, ParameterSampler
+
+SEARCH_STRATEGIES = ["grid", "random", "halving"]
+
+# What every candidate x fold task measures, peak_rss in bytes
+MEASURES = ("score", "fit_time", "score_time", "peak_rss")
+
+# Folds a candidate runs before racing may prune it
+MIN_RACING_FOLDS = 3
+
+# Data shared with the worker processes, memory mapped once per worker
+_shared = {}
+_blas_limits = None
+
+
+class TaskPool:
+    """Worker processes shared by searches, longest tasks first.
+
+    At most `workers` tasks are handed to the processes at a time, the
+    rest wait in a heap ordered by their estimated cost. Data passed to
+    share() is written to disk once and memory mapped by the workers.
+    """
+
+    def __init__(self, cpus: int = None, blas_threads: int = 1):
+        cpus = cpus if cpus and cpus > 0 else os.cpu_count()
+        self.workers = max(1, cpus // blas_threads)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_limit_blas_threads,
+            initargs=(blas_threads,),
+        )
+        self.directory = tempfile.mkdtemp(prefix="hp_tuning_")
+        self.waiting = []
+        self.running = 0
+        self.submitted = 0
+        self.lock = threading.Lock()
+
+    def share(self, *data) -> str:
+        """Write data for the tasks once, returns the key to pass instead."""
+        with self.lock:
+            self.submitted += 1
+            path = os.path.join(self.directory, f"data-{self.submitted}")
+        return save_shared(path, *data)
+
+    def submit(self, function, *args, cost: float = 1.0) -> Future:
+        """Queue function(*args), tasks with a larger cost start first."""
+        future = Future()
+        with self.lock:
+            self.submitted += 1
+            heapq.heappush(
+                self.waiting, (-cost, self.submitted, function, args, future)
+            )
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        started = []
+        with self.lock:
+            while self.waiting and self.running < self.workers:
+                _, _, function, args, future = heapq.heappop(self.waiting)
+                self.running += 1
+                started.append((function, args, future))
+        for function, args, future in started:
+            task = self.executor.submit(function, *args)
+            task.add_done_callback(partial(self._done, future=future))
+
+    def _done(self, task: Future, future: Future):
+        with self.lock:
+            self.running -= 1
+        if task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+        self._dispatch()
+
+    def shutdown(self):
+        self.executor.shutdown()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
+def as_arrays(X, y) -> tuple:
+    """The training data as contiguous float arrays, converted once.
+
+    Trees fit float32 features, so X is float32 when that holds every
+    value exactly, judged by the values rather than the dtypes: the
+    encoder stores its codes as int64, which float32 holds up to 2^24.
+    Otherwise X is float64 and every tree fit converts its rows. y is a
+    float64 vector, also when it comes as a one column DataFrame.
+
+    Parameters
+    ----------
+    X :
+        The features, a DataFrame or an array.
+
+    y :
+        The target, a Series, a one column DataFrame or an array.
+
+    Returns
+    -------
+    tuple
+        (X, y) as C contiguous numpy arrays.
+
+    Examples
+    --------
+    >>> X, y = as_arrays(X_train, y_train)
+
+    """
+    if hasattr(X, "columns"):
+        columns = [X[name].to_numpy() for name in X.columns]
+    else:
+        columns = [np.asarray(X)]
+    exact = all(map(_fits_float32, columns))
+    X = np.ascontiguousarray(np.asarray(X, dtype=np.float32 if exact else np.float64))
+    y = np.ascontiguousarray(np.asarray(y, dtype=np.float64).ravel())
+    return X, y
+
+
+def save_shared(path: str, *data) -> str:
+    """Save arrays for the workers, returns the key to pass instead.
+
+    Every array is saved as a .npy file in the directory path, written
+    under a temporary name and renamed into place, so workers on other
+    hosts never see half of it.
+
+    Parameters
+    ----------
+    path: str :
+        The directory to create.
+
+    *data :
+        The arrays.
+
+    Returns
+    -------
+    str
+        path, loaded by the tasks with read-only memory maps.
+
+    Examples
+    --------
+    >>> save_shared("/tmp/hp_tuning/data-1", X, y)
+
+    """
+    partial = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(partial)
+    for i, array in enumerate(data):
+        np.save(os.path.join(partial, f"{i}.npy"), np.ascontiguousarray(array))
+    os.rename(partial, path)
+    return path
+
+
+class SearchResult:
+    """The outcome of a search, with the GridSearchCV attributes hp_tuning uses.
+
+    cv_results_ has one entry per candidate. For halving these are the
+    scores of the last rung the candidate reached, given by the iter and
+    n_resources entries, and candidates reaching later rungs rank higher.
+    """
+
+    def __init__(self, cv_results: dict):
+        self.cv_results_ = cv_results
+        self.best_index_ = int(np.argmin(cv_results["rank_test_score"]))
+        self.best_params_ = cv_results["params"][self.best_index_]
+        self.best_score_ = cv_results["mean_test_score"][self.best_index_]
+
+
+def search(
+    estimator,
+    param_grid: dict,
+    X,
+    y,
+    strategy: str = "grid",
+    cv=5,
+    scoring: str = None,
+    n_iter: int = 10,
+    factor: int = 3,
+    min_resources: int = None,
+    random_state: int = 42,
+    pool: TaskPool = None,
+    cost=None,
+    min_rows=None,
+    sweep: tuple = None,
+    racing: float = None,
+    store: TrialStore = None,
+    verbose: int = 0,
+) -> SearchResult:
+    """Cross validate the candidates of a parameter grid with a search strategy.
+
+    Parameters
+    ----------
+    estimator :
+        The scikit-learn estimator to tune.
+
+    param_grid: dict :
+        Parameter name to list of values.
+
+    X :
+        The training features.
+
+    y :
+        The training target.
+
+    strategy: str :
+        grid, random or halving. (Default value = "grid")
+
+    cv :
+        Number of KFold splits, or a list of (train, test) row numbers of
+        X. (Default value = 5)
+
+    scoring: str :
+        scikit-learn scoring name. (Default value = None, estimator.score)
+
+    n_iter: int :
+        random: number of sampled candidates. (Default value = 10)
+
+    factor: int :
+        halving: 1 / factor of the candidates move on to a factor times
+        larger subsample. (Default value = 3)
+
+    min_resources: int :
+        halving: rows in the first rung. (Default value = None, chosen so
+        the last rung uses all rows, but no fewer than min_rows needs)
+
+    random_state: int :
+        Seed of the random sampling and the halving subsamples.
+        (Default value = 42)
+
+    pool: TaskPool :
+        Runs the fits, may be shared with other searches.
+        (Default value = None, a pool over all CPUs for this search)
+
+    cost :
+        cost(params, n_rows) estimating the time of one fit, to start
+        expensive fits first. (Default value = None, n_rows)
+
+    min_rows :
+        min_rows(params), the training rows a candidate needs before its
+        parameters change the fit, e.g. max_leaf_nodes x min_samples_leaf
+        for a tree. halving never subsamples below what every candidate
+        needs on every training fold. (Default value = None, 1)
+
+    sweep: tuple :
+        (name, function) for a parameter whose values are all scored by
+        one fit. function(estimator, params, values, X, y, folds) gets
+        the other parameters, the values of name and the KFold (train,
+        test) rows, and returns (scores, fit times, score times) arrays
+        of shape (len(values), len(folds)). It must be picklable and use
+        the same scoring as the search. (Default value = None)
+
+    racing: float :
+        Significance level of the paired t-test pruning a candidate
+        against the best one between folds, e.g. 0.05. halving only
+        races on all rows. (Default value = None, no racing)
+
+    store: TrialStore :
+        Finished fits are looked up in and saved to this store.
+        (Default value = None, nothing is stored)
+
+    verbose: int :
+        Print progress when > 0. (Default value = 0)
+
+    Returns
+    -------
+    SearchResult
+        The cross validation results and the best parameters.
+
+    Examples
+    --------
+    >>> search(model, param_grid, X, y, strategy="random", n_iter=20)
+
+    """
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(
+            f"Unknown search strategy {strategy!r}, expected one of {SEARCH_STRATEGIES}"
+        )
+    if pool is None:
+        with TaskPool() as pool:
+            return search(
+                estimator,
+                param_grid,
+                X,
+                y,
+                strategy=strategy,
+                cv=cv,
+                scoring=scoring,
+                n_iter=n_iter,
+                factor=factor,
+                min_resources=min_resources,
+                random_state=random_state,
+                pool=pool,
+                cost=cost,
+                min_rows=min_rows,
+                sweep=sweep,
+                racing=racing,
+                store=store,
+                verbose=verbose,
+            )
+    cost = cost or (lambda params, n_rows: n_rows)
+    if strategy == "random":
+        candidates = list(
+            ParameterSampler(param_grid, n_iter, random_state=random_state)
+        )
+    else:
+        candidates = list(ParameterGrid(param_grid))
+    scorer = check_scoring(estimator, scoring=scoring)
+    if not isinstance(cv, int):
+        cv = list(cv)
+    n_folds = cv if isinstance(cv, int) else len(cv)
+    # what a stored trial has to match besides its parameters and fold
+    trial = None
+    if store is not None:
+        trial = {
+            "data": _fingerprint(X, y),
+            "model": repr(estimator),
+            "scoring": scoring,
+            "cv": cv if isinstance(cv, int) else _hash(_fold_ids(cv, len(X))),
+        }
+        if sweep is not None:
+            trial["sweep"] = f"{sweep[1].__module__}.{sweep[1].__qualname__}"
+    evaluate = _Evaluator(estimator, X, y, cv, scorer, pool, cost, sweep, store, trial)
+
+    if strategy != "halving":
+        if verbose:
+            print(f"Fitting {n_folds} folds for each of {len(candidates)} candidates")
+        measures, pruned, swept = evaluate(candidates, racing=racing)
+        ranks = _rank(list(zip(pruned, -np.nanmean(measures[:, :, 0], axis=1))))
+        results = _cv_results(candidates, measures, ranks)
+        if racing is not None:
+            results["pruned"] = pruned
+        if sweep is not None:
+            results["swept"] = swept
+        return SearchResult(results)
+
+    n_samples = len(X)
+    rungs = 1 + int(math.floor(math.log(len(candidates), factor)))
+    if min_resources is None:
+        # a smaller subsample fits the same model for several candidates,
+        # which then tie and are pruned arbitrarily
+        needed = max(min_rows(params) for params in candidates) if min_rows else 1
+        floor = max(math.ceil(needed * n_folds / (n_folds - 1)), 2 * n_folds)
+        min_resources = max(n_samples // factor ** (rungs - 1), floor)
+    # nested subsamples: every rung takes the first rows of one permutation
+    permutation = np.random.RandomState(random_state).permutation(n_samples)
+    measures = np.zeros((len(candidates), n_folds, len(MEASURES)))
+    pruned = np.zeros(len(candidates), dtype=bool)
+    swept = np.zeros(len(candidates), dtype=bool)
+    reached = np.zeros(len(candidates), dtype=np.int32)
+    resources = np.zeros(len(candidates), dtype=np.int64)
+    alive = list(range(len(candidates)))
+    for rung in range(rungs):
+        n_rows = min_resources * factor**rung
+        if rung == rungs - 1 or n_rows >= n_samples:
+            n_rows = n_samples
+        rows = None if n_rows == n_samples else np.sort(permutation[:n_rows])
+        if verbose:
+            print(
+                f"Rung {rung}: {n_folds} folds for {len(alive)} candidates on {n_rows} rows"
+            )
+        # subsamples are too noisy to race on, halving prunes them anyway
+        measures[alive], pruned[alive], swept[alive] = evaluate(
+            [candidates[c] for c in alive], rows, None if rows is not None else racing
+        )
+        reached[alive], resources[alive] = rung, n_rows
+        if n_rows == n_samples:
+            break
+        # keep the best 1 / factor that were not pruned, ties go to the
+        # earlier candidate
+        means = np.nanmean(measures[:, :, 0], axis=1)
+        order = sorted(alive, key=lambda c: (pruned[c], -means[c], c))
+        alive = sorted(
+            c for c in order[: math.ceil(len(alive) / factor)] if not pruned[c]
+        )
+        if not alive:
+            break
+
+    # later rungs first, then the candidates not pruned, then by score
+    means = np.nanmean(measures[:, :, 0], axis=1)
+    ranks = _rank(list(zip(-reached, pruned, -means)))
+    results = _cv_results(candidates, measures, ranks)
+    results["iter"] = reached
+    results["n_resources"] = resources
+    if racing is not None:
+        results["pruned"] = pruned
+    if sweep is not None:
+        results["swept"] = swept
+    return SearchResult(results)
+
+
+class _Evaluator:
+    """Runs the fits of one search in the pool, skipping stored trials."""
+
+    def __init__(self, estimator, X, y, cv, scorer, pool, cost, sweep, store, trial):
+        self.estimator = estimator
+        self.X, self.y = X, y
+        self.cv = cv
+        self.scorer = scorer
+        self.pool = pool
+        self.cost = cost
+        self.sweep = sweep
+        self.store = store
+        self.trial = trial
+
+    def __call__(self, candidates: list, rows: np.ndarray = None, racing: float = None):
+        """The MEASURES of every candidate on every fold.
+
+        Returns (measures, pruned, swept), measures of shape (candidates,
+        folds, MEASURES). swept marks the candidates whose fit times and
+        peak RSS are those of a sweep fit shared with other candidates,
+        not their own. With racing, the folds after the first MIN_RACING_FOLDS
+        run one at a time and pruned candidates get NaN for the folds they
+        did not run.
+        """
+        folds = _folds(self.cv, len(self.X), rows)
+        n_rows = len(self.X) if rows is None else len(rows)
+        order, windows = _windows(folds, n_rows)
+        trial = self.trial
+        if self.store is not None and rows is not None:
+            trial = {**trial, "rows": _hash(rows)}
+        results = np.full((len(candidates), len(folds), len(MEASURES)), np.nan)
+        pruned = np.zeros(len(candidates), dtype=bool)
+        swept = np.zeros(len(candidates), dtype=bool)
+        stages = [list(range(len(folds)))]
+        if racing is not None:
+            # nothing is pruned before MIN_RACING_FOLDS folds, so they run
+            # at once, without waiting for each other
+            first = min(MIN_RACING_FOLDS, len(folds))
+            stages = [list(range(first))]
+            stages += [[fold] for fold in range(first, len(folds))]
+        shared = {"order": order, "folds": windows}
+        for stage, stage_folds in enumerate(stages):
+            alive = np.flatnonzero(~pruned)
+            running = []
+            for indices, fold_ids in self._tasks(candidates, alive, stage_folds):
+                future = self._submit(
+                    candidates, indices, fold_ids, folds, rows, trial, shared
+                )
+                cells = [(c, fold) for c in indices for fold in fold_ids]
+                running.append((cells, future))
+                swept[indices] |= len(indices) > 1
+            for cells, future in running:
+                result = future.result() if isinstance(future, Future) else future
+                for cell, values in zip(cells, _cell_results(result)):
+                    results[cell] = values
+            # after the last fold there is nothing left to save
+            n_run = stage_folds[-1] + 1
+            if racing is not None and stage < len(stages) - 1:
+                pruned[alive] = _race(results[alive, :n_run, 0], racing)
+        return results, pruned, swept
+
+    def _submit(self, candidates, indices, fold_ids, folds, rows, trial, shared):
+        """Submit one task, or return its results if they are all stored."""
+        cells = [(c, fold) for c in indices for fold in fold_ids]
+        descriptions = {}
+        if self.store is not None:
+            stored = []
+            for c, fold in cells:
+                description = {**trial, "params": candidates[c], "fold": fold}
+                key = self.store.key(**description)
+                descriptions[c, fold] = (key, description)
+                stored.append(self.store.get(key))
+            if all(result is not None for result in stored):
+                return stored
+
+        params = candidates[indices[0]]
+        # shared once per call, and only when something has to be fitted
+        if "data" not in shared:
+            shared["data"] = self._share(rows, shared["order"])
+        model_params = dict(params)
+        if self.sweep is None:
+            train, test = shared["folds"][fold_ids[0]]
+            future = self.pool.submit(
+                _fit_and_score,
+                self.estimator,
+                model_params,
+                shared["data"],
+                train,
+                test,
+                self.scorer,
+                cost=self.cost(params, len(folds[fold_ids[0]][0])),
+            )
+        else:
+            name, function = self.sweep
+            swept = [candidates[c][name] for c in indices]
+            model_params.pop(name, None)
+            largest = {**params, name: max(swept)}
+            future = self.pool.submit(
+                _sweep_and_score,
+                function,
+                self.estimator,
+                model_params,
+                swept,
+                shared["data"],
+                [shared["folds"][fold] for fold in fold_ids],
+                cost=self.cost(largest, len(folds[0][0])) * len(fold_ids),
+            )
+        if self.store is not None:
+            # saved when it finishes, not when the search does
+            future.add_done_callback(
+                partial(_save_trials, self.store, cells, descriptions)
+            )
+        return future
+
+    def _tasks(self, candidates: list, indices: np.ndarray, fold_ids: list):
+        """(candidate indices, fold ids) of every task.
+
+        One task per candidate and fold, or with a sweep one task per
+        group of candidates differing only in the swept parameter.
+        """
+        if self.sweep is None:
+            return [([c], [fold]) for c in indices for fold in fold_ids]
+        groups = {}
+        for c in indices:
+            others = {
+                name: value
+                for name, value in candidates[c].items()
+                if name != self.sweep[0]
+            }
+            groups.setdefault(repr(sorted(others.items())), []).append(c)
+        return [(group, fold_ids) for group in groups.values()]
+
+    def _share(self, rows: np.ndarray, order: np.ndarray) -> str:
+        """The data handed to the workers, subsampled to rows, in the order of _windows."""
+        X, y = self.X, self.y
+        if order is not None:
+            rows = order if rows is None else rows[order]
+        if rows is not None:
+            X, y = _take(X, rows), _take(y, rows)
+        return self.pool.share(X, y)
+
+
+def _folds(cv, n_samples: int, rows: np.ndarray = None) -> list:
+    """(train, test) positions of every fold, in the subsample rows if given."""
+    if isinstance(cv, int):
+        n_rows = n_samples if rows is None else len(rows)
+        return list(KFold(n_splits=cv).split(np.arange(n_rows)))
+    if rows is None:
+        return [(np.asarray(train), np.asarray(test)) for train, test in cv]
+    # the same folds, restricted to the sorted subsample
+    fold_ids = _fold_ids(cv, n_samples)[rows]
+    return [
+        (np.flatnonzero(fold_ids != k), np.flatnonzero(fold_ids == k))
+        for k in range(len(cv))
+    ]
+
+
+def _windows(folds: list, n_rows: int) -> tuple:
+    """Row order and (train, test) slices making every fold a view.
+
+    When the training rows of every fold are all rows outside its test
+    rows, as with KFold, the rows are ordered by test fold, rows only
+    used for training first, and the order is followed again by its
+    beginning up to the last fold. The test rows of a fold are then one
+    block and its training rows the n_rows rows after it, wrapping
+    around, so the tasks slice both instead of copying them. Returns
+    (None, folds) for other folds.
+    """
+    fold_ids = np.full(n_rows, -1, dtype=np.int64)
+    for k, (_, test) in enumerate(folds):
+        fold_ids[test] = k
+    for k, (train, test) in enumerate(folds):
+        if not (
+            np.array_equal(np.sort(test), np.flatnonzero(fold_ids == k))
+            and np.array_equal(np.sort(train), np.flatnonzero(fold_ids != k))
+        ):
+            return None, folds
+    order = np.argsort(fold_ids, kind="stable")
+    starts = np.searchsorted(fold_ids[order], np.arange(len(folds)), side="left")
+    stops = np.searchsorted(fold_ids[order], np.arange(len(folds)), side="right")
+    order = np.concatenate([order, order[: starts[-1]]])
+    windows = [
+        (slice(stop, n_rows + start), slice(start, stop))
+        for start, stop in zip(starts, stops)
+    ]
+    return order, windows
+
+
+def _fold_ids(cv: list, n_samples: int) -> np.ndarray:
+    """The test fold of every row of explicit (train, test) folds."""
+    fold_ids = np.full(n_samples, -1, dtype=np.int64)
+    for k, (_, test) in enumerate(cv):
+        fold_ids[test] = k
+    return fold_ids
+
+
+def _race(scores: np.ndarray, alpha: float) -> np.ndarray:
+    """Candidates worse than the best one by a one-sided paired t-test.
+
+    scores holds the scores of the candidates still racing on the folds
+    run so far, pruned where the lower confidence bound of the mean
+    difference to the best candidate is above zero. Each candidate is
+    only compared with the best one, at alpha. Correcting for all
+    candidates is too strict at a few folds: Bonferroni over 48 tree
+    candidates needs t > 21.6 after three folds and prunes nothing.
+    """
+    best = np.argmax(scores.mean(axis=1))
+    differences = scores[best] - scores
+    n_candidates, n_folds = scores.shape
+    if n_candidates < 2:
+        return np.zeros(n_candidates, dtype=bool)
+    mean = differences.mean(axis=1)
+    error = differences.std(axis=1, ddof=1) / math.sqrt(n_folds)
+    bound = mean - stats.t.ppf(1 - alpha, n_folds - 1) * error
+    return bound > 0
+
+
+def _rank(keys: list) -> np.ndarray:
+    """Ranks starting at 1 in the order of keys, equal keys share a rank."""
+    order = sorted(range(len(keys)), key=lambda c: keys[c])
+    ranks = np.zeros(len(keys), dtype=np.int32)
+    for position, c in enumerate(order):
+        tied = position and keys[c] == keys[order[position - 1]]
+        ranks[c] = ranks[order[position - 1]] if tied else position + 1
+    return ranks
+
+
+def _save_trials(store: TrialStore, cells: list, descriptions: dict, future: Future):
+    if future.exception() is None:
+        for cell, result in zip(cells, _cell_results(future.result())):
+            key, description = descriptions[cell]
+            store.put(key, result, description)
+
+
+def _cell_results(result) -> np.ndarray:
+    """MEASURES rows of a task, one per candidate x fold."""
+    return np.asarray(result, dtype=np.float64).reshape(-1, len(MEASURES))
+
+
+def _fingerprint(X, y) -> str:
+    """Hash of the training data."""
+    digest = hashlib.sha256()
+    for data in (X, y):
+        if hasattr(data, "columns"):
+            digest.update(repr(list(data.columns)).encode())
+            digest.update(pd.util.hash_pandas_object(data, index=False).values)
+        else:
+            digest.update(np.ascontiguousarray(data).tobytes())
+    return digest.hexdigest()
+
+
+def _hash(rows: np.ndarray) -> str:
+    """Hash of row numbers or fold ids."""
+    return hashlib.sha256(np.ascontiguousarray(rows).tobytes()).hexdigest()
+
+
+def _load_shared(path: str) -> tuple:
+    """The arrays of save_shared, mapped once per worker."""
+    if path not in _shared:
+        names = sorted(os.listdir(path), key=lambda name: int(name.split(".")[0]))
+        _shared[path] = tuple(
+            np.load(os.path.join(path, name), mmap_mode="r") for name in names
+        )
+    return _shared[path]
+
+
+def _fits_float32(values: np.ndarray) -> bool:
+    """Whether float32 holds every value exactly."""
+    if values.dtype.kind == "b":
+        return True
+    if values.dtype.kind in "iu":
+        # integers up to the 24 bit mantissa
+        return values.size == 0 or max(-int(values.min()), int(values.max())) <= 2**24
+    if values.dtype.kind == "f":
+        return values.dtype.itemsize <= 4 or np.array_equal(
+            values.astype(np.float32), values, equal_nan=True
+        )
+    return False
+
+
+def _take(data, rows):
+    """Rows of a DataFrame or an array, a view for a slice."""
+    return data.iloc[rows] if hasattr(data, "iloc") else data[rows]
+
+
+def _limit_blas_threads(blas_threads: int):
+    """Worker initializer, caps the BLAS and OpenMP threads of the process."""
+    global _blas_limits
+    _blas_limits = threadpool_limits(limits=blas_threads)
+
+
+def _fit_and_score(estimator, params, data, train, test, scorer):
+    """Fit one candidate on one fold, returns its MEASURES."""
+    X, y = _load_shared(data)
+    _reset_peak_rss()
+    model = clone(estimator).set_params(**params)
+    start = time.perf_counter()
+    model.fit(_take(X, train), _take(y, train))
+    fitted = time.perf_counter()
+    score = scorer(model, _take(X, test), _take(y, test))
+    return score, fitted - start, time.perf_counter() - fitted, _peak_rss()
+
+
+def _sweep_and_score(function, estimator, params, values, data, folds):
+    """All values of a swept parameter on all folds, from one fit per fold."""
+    X, y = _load_shared(data)
+    _reset_peak_rss()
+    scores, fit_times, score_times = function(estimator, params, values, X, y, folds)
+    # the peak of the shared fits is the peak of every candidate
+    peak_rss = np.full(scores.shape, _peak_rss())
+    # candidate x fold x MEASURES
+    return np.stack([scores, fit_times, score_times, peak_rss], axis=-1)
+
+
+def _reset_peak_rss():
+    """Start a new peak RSS measurement where the kernel supports it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss() -> float:
+    """Peak resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/status", "r") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return float(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # since the process started, in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return float(peak if sys.platform == "darwin" else peak * 1024)
+
+
+def _cv_results(candidates, measures, ranks) -> dict:
+    """The GridSearchCV style cv_results_ dict, plus the peak RSS."""
+    scores, fit_times, score_times, peak_rss = np.moveaxis(measures, -1, 0)
+    results = {"params": candidates}
+    for k in range(scores.shape[1]):
+        results[f"split{k}_test_score"] = scores[:, k]
+    results.update(
+        {
+            "mean_test_score": np.nanmean(scores, axis=1),
+            "std_test_score": np.nanstd(scores, axis=1),
+            "rank_test_score": ranks,
+            "mean_fit_time": np.nanmean(fit_times, axis=1),
+            "std_fit_time": np.nanstd(fit_times, axis=1),
+            "mean_score_time": np.nanmean(score_times, axis=1),
+            "std_score_time": np.nanstd(score_times, axis=1),
+            "peak_rss": np.nanmax(peak_rss, axis=1),
+        }
+    )
+    return results
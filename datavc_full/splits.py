@@ -0,0 +1,388 @@
+"""Index based train/test/val splits and K-fold assignments.
+
+Instead of one parquet copy of the data per split, the data is written
+once as one .npy file per column, in the column's own dtype, and every
+row gets
+
+- a fold id (int8) from KFold, for all n_splits folds, and
+- a split code (int8) from SPLIT_CODES, the train/test/val masks.
+
+The rows are stored split by split, in the order the split produced
+them, so each split is a contiguous slice of the memory mapped columns
+and no stage reads a copy of the data. The disk use does not grow with
+the number of folds.
+
+Split outputs are cached in data/transform/splits/<key>, keyed by a hash
+of the input content and the split parameters, and linked into
+data/transform/validation. Repeating a split reuses its directory.
+
+Functions:
+----------
+save_index_splits: Write the columns, fold ids and split codes.
+has_index_splits: Whether a directory holds index based splits.
+load_split: The features and target of the train, test or val rows.
+load_fold: Train and test row numbers of one of the K folds.
+load_cv_folds: Cross validation folds within the rows of a split.
+hash_split: Split codes from a hash of a stable key and a seed.
+split_cache_key: Hash of the input content and the split parameters.
+publish_split: Link a cached split into the directory stages read.
+
+How to use:
+-----------
+>>> save_index_splits("data/transform/validation", X, y, rows, fold)
+>>> X_train, y_train = load_split("data/transform/validation", "train")
+>>> train_rows, test_rows = load_fold("data/transform/validation", 3)
+>>> folds = load_cv_folds("data/transform/validation", "train")
+>>> split = hash_split(chunk, test_size=0.2, seed=42, key=["policy_id"])
+>>> key = split_cache_key(["data/transform/insurance_000.parquet"], params)
+>>> publish_split(f"data/transform/splits/{key}", "data/transform/validation")
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Split code of every row in split.npy
+SPLIT_CODES = {"train": 0, "test": 1, "val": 2}
+
+# One directory of split outputs per cache key
+SPLIT_CACHE = "data/transform/splits"
+
+
+def save_index_splits(
+    output_dir: str,
+    X: pd.DataFrame,
+    y: pd.Series,
+    rows: dict,
+    fold: np.ndarray = None,
+) -> None:
+    """Write the data once plus the fold id and split code of every row.
+
+    Parameters
+    ----------
+    output_dir: str :
+        Directory to write the column files, split.npy, fold.npy and
+        splits.json to.
+
+    X: pd.DataFrame :
+        The features.
+
+    y: pd.Series :
+        The target.
+
+    rows: dict :
+        Row numbers of X for "train", "test" and "val".
+
+    fold: np.ndarray :
+        KFold fold id of every row of X. (Default value = None, no folds)
+
+    Returns
+    -------
+    None
+
+    Examples
+    --------
+    >>> save_index_splits(
+    ...     "data/transform/validation",
+    ...     X,
+    ...     y,
+    ...     {"train": train_rows, "test": test_rows, "val": val_rows},
+    ...     fold,
+    ... )
+
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    order = np.concatenate([rows[name] for name in SPLIT_CODES])
+    # one file per column keeps the int8 codes and float32 values compact
+    for i, column in enumerate(X.columns):
+        np.save(os.path.join(output_dir, f"x_{i}.npy"), X[column].to_numpy()[order])
+    np.save(os.path.join(output_dir, "y.npy"), y.to_numpy()[order])
+    split = np.repeat(
+        np.array(list(SPLIT_CODES.values()), dtype=np.int8),
+        [len(rows[name]) for name in SPLIT_CODES],
+    )
+    np.save(os.path.join(output_dir, "split.npy"), split)
+    fold_path = os.path.join(output_dir, "fold.npy")
+    if fold is not None:
+        np.save(fold_path, fold[order].astype(np.int8))
+    elif os.path.exists(fold_path):
+        os.remove(fold_path)
+    with open(os.path.join(output_dir, "splits.json"), "w") as outfile:
+        json.dump(
+            {
+                "columns": list(X.columns),
+                "target": y.name,
+                "n_splits": None if fold is None else int(fold.max()) + 1,
+            },
+            outfile,
+            indent=2,
+        )
+
+
+def has_index_splits(output_dir: str) -> bool:
+    """Whether output_dir holds splits written by save_index_splits."""
+    return os.path.exists(os.path.join(output_dir, "splits.json"))
+
+
+def load_split(output_dir: str, name: str) -> tuple:
+    """The features and target of the train, test or val rows.
+
+    Parameters
+    ----------
+    output_dir: str :
+        Directory written by save_index_splits.
+
+    name: str :
+        "train", "test" or "val".
+
+    Returns
+    -------
+    tuple
+        (X, y) as DataFrames over the memory mapped rows, y with the
+        single target column like the y_*.parquet files.
+
+    Examples
+    --------
+    >>> X_train, y_train = load_split("data/transform/validation", "train")
+
+    """
+    with open(os.path.join(output_dir, "splits.json"), "r") as infile:
+        layout = json.load(infile)
+    start, stop = _split_slice(output_dir, name)
+    X = pd.DataFrame(
+        {
+            column: _load_rows(output_dir, f"x_{i}.npy", start, stop)
+            for i, column in enumerate(layout["columns"])
+        },
+        copy=False,
+    )
+    y = pd.DataFrame(
+        {layout["target"]: _load_rows(output_dir, "y.npy", start, stop)}, copy=False
+    )
+    return X, y
+
+
+def load_fold(output_dir: str, fold: int) -> tuple:
+    """Train and test row numbers of one of the K folds.
+
+    Parameters
+    ----------
+    output_dir: str :
+        Directory written by save_index_splits with fold ids.
+
+    fold: int :
+        The fold used as test set, 0 to n_splits - 1.
+
+    Returns
+    -------
+    tuple
+        (train_rows, test_rows) row numbers into the column files.
+
+    Examples
+    --------
+    >>> train_rows, test_rows = load_fold("data/transform/validation", 3)
+
+    """
+    folds = np.load(os.path.join(output_dir, "fold.npy"), mmap_mode="r")
+    return np.flatnonzero(folds != fold), np.flatnonzero(folds == fold)
+
+
+def load_cv_folds(output_dir: str, name: str = "train") -> list:
+    """Cross validation folds within the rows of a split, from the fold ids.
+
+    Every fold id found among the rows of the split is the test set of
+    one fold, e.g. folds 1 to n_splits - 1 for the train rows of a kfold
+    split, whose fold 0 is the test set.
+
+    Parameters
+    ----------
+    output_dir: str :
+        Directory written by save_index_splits.
+
+    name: str :
+        "train", "test" or "val". (Default value = "train")
+
+    Returns
+    -------
+    list
+        (train, test) positions into the rows load_split returns, or
+        None when the split was written without fold ids.
+
+    Examples
+    --------
+    >>> folds = load_cv_folds("data/transform/validation", "train")
+    >>> search(model, param_grid, X_train, y_train, cv=folds)
+
+    """
+    fold_path = os.path.join(output_dir, "fold.npy")
+    if not os.path.exists(fold_path):
+        return None
+    start, stop = _split_slice(output_dir, name)
+    folds = np.load(fold_path, mmap_mode="r")[start:stop]
+    return [
+        (np.flatnonzero(folds != fold), np.flatnonzero(folds == fold))
+        for fold in np.unique(folds)
+    ]
+
+
+def hash_split(
+    data: pd.DataFrame, test_size: float, seed: int = 42, key: list = None
+) -> np.ndarray:
+    """Split codes from a hash of a stable key (or the whole row) and a seed.
+
+    The split of a row only depends on its key, so chunks can be split
+    one at a time and appending rows never moves existing rows between
+    splits. As with the other strategies, test_size of the rows go to
+    test and test_size of the remaining rows to val.
+
+    Parameters
+    ----------
+    data: pd.DataFrame :
+        The rows to split, e.g. one chunk of a larger file.
+
+    test_size: float :
+        Fraction of the rows in the test set.
+
+    seed: int :
+        Seed mixed into the hash, a different seed gives other splits.
+        (Default value = 42)
+
+    key: list :
+        Columns identifying a row. (Default value = None, all columns)
+
+    Returns
+    -------
+    np.ndarray
+        Split code of every row, see SPLIT_CODES.
+
+    Examples
+    --------
+    >>> hash_split(chunk, test_size=0.2, seed=42, key=["policy_id"])
+
+    """
+    hashes = pd.util.hash_pandas_object(
+        data[key] if key else data, index=False
+    ).to_numpy()
+    # splitmix64 finalizer of hash and seed, for uniform high bits
+    golden = (seed * 0x9E3779B97F4A7C15) % 2**64
+    mixed = hashes + np.uint64(golden)
+    mixed = (mixed ^ (mixed >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    mixed = (mixed ^ (mixed >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    mixed ^= mixed >> np.uint64(31)
+    uniform = (mixed >> np.uint64(11)).astype(np.float64) / 2.0**53
+    split = np.full(len(data), SPLIT_CODES["train"], dtype=np.int8)
+    split[uniform < test_size + (1 - test_size) * test_size] = SPLIT_CODES["val"]
+    split[uniform < test_size] = SPLIT_CODES["test"]
+    return split
+
+
+def split_cache_key(paths: list, params: dict) -> str:
+    """Hash of the content of the input files and the split parameters.
+
+    File hashes are remembered by path, size and modification time in
+    SPLIT_CACHE/content_hashes.json, so unchanged files are not read again.
+
+    Parameters
+    ----------
+    paths: list :
+        Input files or directories, e.g. the parquet dataset and the
+        scripts doing the split.
+
+    params: dict :
+        The split parameters, JSON serializable.
+
+    Returns
+    -------
+    str
+        The cache key.
+
+    Examples
+    --------
+    >>> split_cache_key(["data/transform/insurance_000.parquet"], {"test_size": 0.2})
+
+    """
+    memo_path = os.path.join(SPLIT_CACHE, "content_hashes.json")
+    memo = {}
+    if os.path.exists(memo_path):
+        with open(memo_path, "r") as infile:
+            memo = json.load(infile)
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+    for path in paths:
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(path)
+                for name in names
+            )
+        for file in files:
+            stat = os.stat(file)
+            seen = memo.get(os.path.abspath(file))
+            if seen is None or seen[:2] != [stat.st_size, stat.st_mtime_ns]:
+                content = hashlib.sha256()
+                with open(file, "rb") as infile:
+                    for block in iter(lambda: infile.read(1 << 20), b""):
+                        content.update(block)
+                seen = [stat.st_size, stat.st_mtime_ns, content.hexdigest()]
+                memo[os.path.abspath(file)] = seen
+            digest.update(os.path.relpath(file, path).encode())
+            digest.update(seen[2].encode())
+    os.makedirs(SPLIT_CACHE, exist_ok=True)
+    with open(memo_path, "w") as outfile:
+        json.dump(memo, outfile)
+    return digest.hexdigest()[:16]
+
+
+def publish_split(cache_dir: str, output_dir: str) -> None:
+    """Link the files of a cached split into output_dir.
+
+    Earlier files in output_dir are removed. Hard links cost no copy;
+    files are copied where linking is not possible.
+
+    Parameters
+    ----------
+    cache_dir: str :
+        A SPLIT_CACHE/<key> directory.
+
+    output_dir: str :
+        The directory the other stages read the split from.
+
+    Returns
+    -------
+    None
+
+    Examples
+    --------
+    >>> publish_split("data/transform/splits/0123456789abcdef", "data/transform/validation")
+
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for name in os.listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        if os.path.isfile(path) or os.path.islink(path):
+            os.remove(path)
+    for name in os.listdir(cache_dir):
+        source = os.path.join(cache_dir, name)
+        try:
+            os.link(source, os.path.join(output_dir, name))
+        except OSError:
+            shutil.copy2(source, os.path.join(output_dir, name))
+
+
+def _split_slice(output_dir: str, name: str) -> tuple:
+    """(start, stop) of the rows of a split in the column files."""
+    split = np.load(os.path.join(output_dir, "split.npy"), mmap_mode="r")
+    # the split codes are sorted, so the rows of a split are one slice
+    start = np.searchsorted(split, SPLIT_CODES[name], side="left")
+    stop = np.searchsorted(split, SPLIT_CODES[name], side="right")
+    return int(start), int(stop)
+
+
+def _load_rows(output_dir: str, file_name: str, start: int, stop: int) -> np.ndarray:
+    """Rows start to stop of a memory mapped column file."""
+    # copy on write, estimators expect writeable arrays
+    values = np.load(os.path.join(output_dir, file_name), mmap_mode="c")
+    return values[start:stop]
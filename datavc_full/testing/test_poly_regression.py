@@ -0,0 +1,124 @@
+"""poly_regression matches refitting the shipped models on every fold."""
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import GridSearchCV, KFold
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+from poly_regression import (
+    cross_validate_degrees,
+    cross_validate_linear,
+    polynomial_regression,
+)
+from search import TaskPool, search
+
+DEGREES = [1, 2, 3, 4]
+
+
+def make_data(seed: int = 42, n_rows: int = 500):
+    rng = np.random.RandomState(seed)
+    X = np.column_stack(
+        [
+            rng.randint(18, 65, n_rows),
+            rng.randint(0, 2, n_rows),
+            rng.normal(30, 6, n_rows),
+            rng.randint(0, 6, n_rows),
+            rng.randint(0, 2, n_rows),
+            rng.randint(0, 4, n_rows),
+        ]
+    ).astype(np.float64)
+    y = (
+        250 * X[:, 0]
+        + 24000 * X[:, 4]
+        + 400 * X[:, 2] * X[:, 4]
+        + rng.normal(0, 4000, n_rows)
+    )
+    return X, y
+
+
+def grid_mse(estimator, param_grid, X, y, folds):
+    """Test MSE of every candidate on every fold, from GridSearchCV."""
+    grid_search = GridSearchCV(
+        estimator, param_grid, cv=folds, scoring="neg_mean_squared_error"
+    ).fit(X, y)
+    return -np.column_stack(
+        [grid_search.cv_results_[f"split{k}_test_score"] for k in range(len(folds))]
+    )
+
+
+@pytest.mark.parametrize("interaction_only", [False, True])
+def test_mse_matches_grid_search(interaction_only):
+    X, y = make_data()
+    folds = list(KFold(n_splits=5).split(X))
+    # small batches so the statistics are accumulated over several passes
+    mse, fit_times, score_times = cross_validate_linear(
+        X, y, folds, DEGREES, interaction_only, batch_size=128
+    )
+    expected = grid_mse(
+        polynomial_regression(),
+        {"poly__degree": DEGREES, "poly__interaction_only": [interaction_only]},
+        X,
+        y,
+        folds,
+    )
+    np.testing.assert_allclose(mse, expected, rtol=1e-8)
+    assert fit_times.shape == score_times.shape == expected.shape
+
+
+def test_degree_one_matches_linear_regression():
+    X, y = make_data()
+    folds = list(KFold(n_splits=5).split(X))
+    mse, _, _ = cross_validate_linear(X, y, folds, [1])
+    model = Pipeline([("scale", StandardScaler()), ("linear", LinearRegression())])
+    expected = grid_mse(model, {"linear__fit_intercept": [True]}, X, y, folds)
+    np.testing.assert_allclose(mse, expected, rtol=1e-8)
+
+
+def test_polynomial_regression_matches_linear_regression_on_full_rank_data():
+    # without binary columns the expansion has full rank, and the model is
+    # PolynomialFeatures + LinearRegression
+    X, y = make_data()
+    X = X[:, [0, 2]]
+    model = polynomial_regression(degree=3).fit(X, y)
+    expected = Pipeline(
+        [("poly", PolynomialFeatures(3)), ("linear", LinearRegression())]
+    ).fit(X, y)
+    np.testing.assert_allclose(model.predict(X), expected.predict(X), rtol=1e-6)
+
+
+def test_sweep_returns_negative_mse():
+    X, y = make_data()
+    folds = list(KFold(n_splits=5).split(X))
+    scores, _, _ = cross_validate_degrees(
+        polynomial_regression(), {"poly__interaction_only": False}, [2, 3], X, y, folds
+    )
+    expected = grid_mse(polynomial_regression(), {"poly__degree": [2, 3]}, X, y, folds)
+    np.testing.assert_allclose(-scores, expected, rtol=1e-8)
+
+
+def test_swept_search_matches_grid_search():
+    # the search hp_tuning runs, every degree scored from one sweep per fold
+    X, y = make_data()
+    param_grid = {"poly__degree": [2, 3, 4], "poly__interaction_only": [False, True]}
+    with TaskPool(cpus=2) as pool:
+        result = search(
+            polynomial_regression(),
+            param_grid,
+            X,
+            y,
+            scoring="neg_mean_squared_error",
+            pool=pool,
+            sweep=("poly__degree", cross_validate_degrees),
+        )
+    grid_search = GridSearchCV(
+        polynomial_regression(), param_grid, cv=5, scoring="neg_mean_squared_error"
+    ).fit(X, y)
+    # both enumerate the candidates in ParameterGrid order
+    assert result.cv_results_["params"] == grid_search.cv_results_["params"]
+    np.testing.assert_allclose(
+        result.cv_results_["mean_test_score"],
+        grid_search.cv_results_["mean_test_score"],
+        rtol=1e-8,
+    )
+    assert result.best_params_ == grid_search.best_params_
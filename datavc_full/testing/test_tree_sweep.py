@@ -0,0 +1,50 @@
+"""tree_sweep scores every max_leaf_nodes like a fit per value."""
+
+import numpy as np
+import pytest
+from sklearn.model_selection import GridSearchCV, KFold
+from sklearn.tree import DecisionTreeRegressor
+from tree_sweep import cross_validate_leaf_nodes
+
+MAX_LEAF_NODES = [2, 3, 4, 6, 8, 10, 16, 25, None]
+
+
+def make_data(seed: int = 1993, n_rows: int = 400):
+    rng = np.random.RandomState(seed)
+    X = np.column_stack(
+        [
+            rng.randint(18, 65, n_rows),
+            rng.randint(0, 2, n_rows),
+            rng.normal(30, 6, n_rows),
+            rng.randint(0, 4, n_rows),
+        ]
+    ).astype(np.float64)
+    y = 250 * X[:, 0] + 20000 * X[:, 1] * (X[:, 2] > 30) + rng.normal(0, 3000, n_rows)
+    return X, y
+
+
+@pytest.mark.parametrize(
+    "criterion", ["squared_error", "friedman_mse", "absolute_error", "poisson"]
+)
+@pytest.mark.parametrize("min_samples_leaf", [1, 10])
+def test_scores_equal_grid_search(criterion, min_samples_leaf):
+    X, y = make_data()
+    y = np.abs(y)
+    estimator = DecisionTreeRegressor(random_state=1993)
+    params = {"criterion": criterion, "min_samples_leaf": min_samples_leaf}
+    grid = GridSearchCV(
+        estimator.set_params(**params),
+        {"max_leaf_nodes": MAX_LEAF_NODES},
+        cv=5,
+    ).fit(X, y)
+    expected = np.column_stack(
+        [grid.cv_results_[f"split{k}_test_score"] for k in range(5)]
+    )
+
+    folds = list(KFold(n_splits=5).split(X))
+    scores, fit_times, score_times = cross_validate_leaf_nodes(
+        DecisionTreeRegressor(random_state=1993), params, MAX_LEAF_NODES, X, y, folds
+    )
+
+    np.testing.assert_array_equal(scores, expected)
+    assert fit_times.shape == score_times.shape == expected.shape
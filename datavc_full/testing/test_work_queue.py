@@ -0,0 +1,95 @@
+"""work_queue hands every task to one worker and every answer to one future."""
+
+import os
+import time
+import pickle
+import threading
+from work_queue import WorkQueue, _publish, worker
+
+HEARTBEAT = 0.05
+POLL = 0.01
+
+
+def record(directory: str, task: int) -> int:
+    """A task leaving one file per run, so runs can be counted."""
+    path = os.path.join(directory, f"{task}.{threading.get_ident()}.{time.time_ns()}")
+    open(path, "w").close()
+    return task
+
+
+def start_workers(directory: str, n_workers: int) -> list:
+    threads = [
+        threading.Thread(target=worker, args=(directory, 1, HEARTBEAT, POLL))
+        for _ in range(n_workers)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_every_task_runs_once(tmp_path):
+    runs = tmp_path / "runs"
+    runs.mkdir()
+    queue = str(tmp_path / "queue")
+    with WorkQueue(queue, heartbeat=HEARTBEAT, poll=POLL) as pool:
+        futures = [pool.submit(record, str(runs), task) for task in range(40)]
+        # several workers race for the same task files
+        threads = start_workers(queue, 4)
+        results = [future.result(timeout=30) for future in futures]
+    for thread in threads:
+        thread.join()
+
+    assert results == list(range(40))
+    counts = {}
+    for name in os.listdir(runs):
+        task = int(name.split(".")[0])
+        counts[task] = counts.get(task, 0) + 1
+    assert counts == {task: 1 for task in range(40)}
+
+
+def test_stale_claim_is_requeued(tmp_path):
+    runs = tmp_path / "runs"
+    runs.mkdir()
+    queue = str(tmp_path / "queue")
+    with WorkQueue(queue, heartbeat=HEARTBEAT, poll=POLL) as pool:
+        future = pool.submit(record, str(runs), 7)
+        # a worker claimed the task and died without touching it again
+        (name,) = os.listdir(os.path.join(queue, "tasks"))
+        claimed = os.path.join(queue, "claimed", f"{name}.gone-1")
+        os.rename(os.path.join(queue, "tasks", name), claimed)
+        long_ago = time.time() - 60
+        os.utime(claimed, (long_ago, long_ago))
+
+        threads = start_workers(queue, 1)
+        assert future.result(timeout=30) == 7
+    for thread in threads:
+        thread.join()
+
+    assert len(os.listdir(runs)) == 1
+    assert os.listdir(os.path.join(queue, "claimed")) == []
+
+
+def test_duplicate_answers_are_ignored(tmp_path):
+    runs = tmp_path / "runs"
+    runs.mkdir()
+    queue = str(tmp_path / "queue")
+    with WorkQueue(queue, heartbeat=HEARTBEAT, poll=POLL) as pool:
+        answered = pool.submit(record, str(runs), 1)
+        (name,) = os.listdir(os.path.join(queue, "tasks"))
+        task_id = name[: -len(".task")].split("-", 1)[1]
+        threads = start_workers(queue, 1)
+        assert answered.result(timeout=30) == 1
+
+        # the second answer of a task run twice after a requeue
+        duplicate = os.path.join(queue, "results", f"{task_id}.result")
+        _publish(duplicate, lambda outfile: pickle.dump(("ok", 2), outfile))
+        deadline = time.time() + 30
+        while os.path.exists(duplicate) and time.time() < deadline:
+            time.sleep(POLL)
+
+        assert not os.path.exists(duplicate)
+        assert answered.result() == 1
+        # the collector keeps answering the tasks after it
+        assert pool.submit(record, str(runs), 3).result(timeout=30) == 3
+    for thread in threads:
+        thread.join()
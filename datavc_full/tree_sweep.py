@@ -0,0 +1,150 @@
+"""Every max_leaf_nodes of a decision tree sweep from one fit.
+
+With max_leaf_nodes set, DecisionTreeRegressor grows the tree best
+first: it repeatedly splits the leaf with the largest impurity
+improvement until the tree has max_leaf_nodes leaves. The tree with L
+leaves is therefore the tree with more leaves after its first L - 1
+splits. The builder numbers the two children of the t-th split
+2t + 1 and 2t + 2, so the first L - 1 splits are the nodes with an id
+up to 2L - 2, and the tree with L leaves predicts with the value of
+the deepest such node on the path of a row.
+
+One tree per fold is grown to the largest leaf budget and all smaller
+budgets are scored from it, giving the same predictions as a fit per
+max_leaf_nodes.
+
+Functions:
+----------
+truncated_predict: Predictions of a best first tree cut to fewer leaves.
+cross_validate_leaf_nodes: The search sweep function for max_leaf_nodes.
+
+How to use:
+-----------
+>>> model = DecisionTreeRegressor(max_leaf_nodes=10).fit(X, y)
+>>> truncated_predict(model, X_test, 4)
+"""
+
+import time
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import r2_score
+from search import _take
+
+
+def truncated_predict(model, X, max_leaf_nodes: int) -> np.ndarray:
+    """Predictions of a fitted best first tree cut to max_leaf_nodes leaves.
+
+    Parameters
+    ----------
+    model :
+        A DecisionTreeRegressor fitted with max_leaf_nodes at least as
+        large as this one.
+
+    X :
+        The rows to predict.
+
+    max_leaf_nodes: int :
+        The leaf budget of the cut tree.
+
+    Returns
+    -------
+    np.ndarray
+        The predictions of DecisionTreeRegressor(max_leaf_nodes=...)
+        fitted with the same data and parameters.
+
+    Examples
+    --------
+    >>> truncated_predict(model, X_test, 4)
+
+    """
+    tree = model.tree_
+    return tree.value[_truncated_nodes(tree, max_leaf_nodes)[model.apply(X)], 0, 0]
+
+
+def cross_validate_leaf_nodes(
+    estimator, params: dict, values: list, X, y, folds: list
+) -> tuple:
+    """R² of DecisionTreeRegressor for every max_leaf_nodes on every fold.
+
+    The search sweep function for max_leaf_nodes, see search.search. It
+    scores like DecisionTreeRegressor.score, for searches without a
+    scoring.
+
+    Parameters
+    ----------
+    estimator :
+        The DecisionTreeRegressor of the search.
+
+    params: dict :
+        The other parameters of the candidates.
+
+    values: list :
+        The max_leaf_nodes values. None grows a full tree of its own.
+
+    X :
+        The features.
+
+    y :
+        The target.
+
+    folds: list :
+        (train rows, test rows) of every fold.
+
+    Returns
+    -------
+    tuple
+        (scores, fit times, score times), arrays of shape
+        (len(values), len(folds)). The fit time is that of the shared
+        fit.
+
+    Examples
+    --------
+    >>> cross_validate_leaf_nodes(DecisionTreeRegressor(), {}, [4, 8], X, y, folds)
+
+    """
+    budgets = [value for value in values if value is not None]
+    shape = (len(values), len(folds))
+    scores, fit_times, score_times = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    for k, (train, test) in enumerate(folds):
+        X_train, y_train = _take(X, train), _take(y, train)
+        X_test, y_test = _take(X, test), _take(y, test)
+        best_first = full = None
+        if budgets:
+            best_first = _fit(
+                estimator, {**params, "max_leaf_nodes": max(budgets)}, X_train, y_train
+            )
+        if None in values:
+            full = _fit(estimator, {**params, "max_leaf_nodes": None}, X_train, y_train)
+        for i, value in enumerate(values):
+            model, fit_time = full if value is None else best_first
+            start = time.perf_counter()
+            if value is None:
+                prediction = model.predict(X_test)
+            else:
+                prediction = truncated_predict(model, X_test, value)
+            scores[i, k] = r2_score(y_test, prediction)
+            fit_times[i, k] = fit_time
+            score_times[i, k] = time.perf_counter() - start
+    return scores, fit_times, score_times
+
+
+def _fit(estimator, params: dict, X, y) -> tuple:
+    """The fitted tree and its fit time."""
+    model = clone(estimator).set_params(**params)
+    start = time.perf_counter()
+    model.fit(X, y)
+    return model, time.perf_counter() - start
+
+
+def _truncated_nodes(tree, max_leaf_nodes: int) -> np.ndarray:
+    """Node of the cut tree that every node of the full tree falls in."""
+    last = 2 * max_leaf_nodes - 2
+    parent = np.zeros(tree.node_count, dtype=np.intp)
+    internal = np.flatnonzero(tree.children_left >= 0)
+    parent[tree.children_left[internal]] = internal
+    parent[tree.children_right[internal]] = internal
+    nodes = np.arange(tree.node_count)
+    # children have larger ids than their parent, so one pass in id order
+    for node in range(last + 1, tree.node_count):
+        nodes[node] = nodes[parent[node]]
+    return nodes
@@ -0,0 +1,89 @@
+"""Persistent store of hyperparameter search trials.
+
+Every candidate x fold fit is a trial. Its score, timings and peak
+memory are saved
+in a SQLite database as soon as it finishes, keyed by a hash of the
+training data, the model, the parameters and the fold. A search that
+is interrupted and restarted, or run again with a few more values in
+hp_config.json, only fits the trials that are not in the store yet.
+
+Classes:
+--------
+TrialStore: SQLite store of trial results.
+
+How to use:
+-----------
+>>> store = TrialStore("model_output/hp_trials.sqlite")
+>>> key = store.key(data=data_hash, model="LinearRegression()", params={}, fold=0)
+>>> store.put(key, (score, fit_time, score_time, peak_rss))
+>>> store.get(key)
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+
+TRIALS_PATH = "model_output/hp_trials.sqlite"
+
+
+class TrialStore:
+    """SQLite store of trial results, safe to use from several threads."""
+
+    def __init__(self, path: str = TRIALS_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS trials ("
+            "key TEXT PRIMARY KEY, description TEXT, "
+            "score REAL, fit_time REAL, score_time REAL, peak_rss REAL)"
+        )
+        columns = [
+            row[1] for row in self.connection.execute("PRAGMA table_info(trials)")
+        ]
+        if "peak_rss" not in columns:
+            # stores written before the peak RSS was measured
+            self.connection.execute("ALTER TABLE trials ADD COLUMN peak_rss REAL")
+        self.connection.commit()
+
+    @staticmethod
+    def key(**parts) -> str:
+        """Hash of everything that determines the result of a trial."""
+        description = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def get(self, key: str):
+        """(score, fit time, score time, peak RSS) of a finished trial, else None."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT score, fit_time, score_time, peak_rss FROM trials WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        # SQLite keeps NaN as NULL, as are peak RSS values of old stores
+        return tuple(float("nan") if value is None else value for value in row)
+
+    def put(self, key: str, result: tuple, description: dict = None):
+        """Save (score, fit time, score time, peak RSS), committed right away."""
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO trials "
+                "(key, description, score, fit_time, score_time, peak_rss) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(description, default=str), *map(float, result)),
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
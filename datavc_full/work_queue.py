@@ -0,0 +1,342 @@
+"""File based work queue for hyperparameter searches across hosts.
+
+A drop-in replacement for search.TaskPool: the coordinator (hp_tuning.py)
+writes every candidate x fold task as a file into a queue directory on a
+filesystem shared by all hosts, and any number of worker processes, on
+this host or others, claim, run and answer them. No broker is needed.
+
+    <queue>/data/      data shared with the tasks, written once
+    <queue>/tasks/     waiting tasks, the most expensive sorts first
+    <queue>/claimed/   tasks being run, renamed here by one worker
+    <queue>/results/   answers, picked up by the coordinator
+    <queue>/stop       written when the coordinator is done
+
+Claiming a task is a rename from tasks/ to claimed/, which succeeds for
+exactly one worker. Results are written to a temporary file and renamed
+into results/, so the coordinator never reads half a result. Workers
+touch their claimed task while running it, and tasks whose worker stops
+doing so are put back into tasks/ for another worker.
+
+Classes:
+--------
+WorkQueue: The coordinator side, with the TaskPool interface.
+
+Functions:
+----------
+worker: Claim and run tasks until the coordinator is done.
+
+How to use:
+-----------
+>>> with WorkQueue("data/hp_queue", local_workers=4) as pool:
+...     result = search(model, param_grid, X, y, pool=pool)
+
+On every other host sharing data/hp_queue, from the project directory
+so the relative paths in the tasks resolve the same way:
+
+    python work_queue.py data/hp_queue --blas_threads 1
+"""
+
+import os
+import sys
+import math
+import time
+import uuid
+import pickle
+import shutil
+import socket
+import argparse
+import threading
+import traceback
+import subprocess
+from concurrent.futures import Future
+from threadpoolctl import threadpool_limits
+from search import save_shared
+
+
+class WorkQueue:
+    """Coordinator of a file based work queue, used like a TaskPool.
+
+    Parameters
+    ----------
+    directory: str :
+        The queue directory, on a filesystem shared with the workers.
+
+    local_workers: int :
+        Worker processes started on this host. (Default value = 0, only
+        workers started separately)
+
+    blas_threads: int :
+        BLAS threads of every local worker. (Default value = 1)
+
+    heartbeat: float :
+        Seconds between the touches of a running task. A task untouched
+        for three heartbeats is handed to another worker.
+        (Default value = 10.0)
+
+    poll: float :
+        Seconds between looks for results. (Default value = 0.1)
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        local_workers: int = 0,
+        blas_threads: int = 1,
+        heartbeat: float = 10.0,
+        poll: float = 0.1,
+    ):
+        self.directory = directory
+        self.heartbeat = heartbeat
+        self.poll = poll
+        # leftovers of an earlier run would be run again or stop the workers
+        for name in ("data", "tasks", "claimed", "results"):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+            os.makedirs(os.path.join(directory, name))
+        if os.path.exists(os.path.join(directory, "stop")):
+            os.remove(os.path.join(directory, "stop"))
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+        self.collector.start()
+        self.processes = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    os.path.abspath(__file__),
+                    directory,
+                    "--blas_threads",
+                    str(blas_threads),
+                    "--heartbeat",
+                    str(heartbeat),
+                ]
+            )
+            for _ in range(local_workers)
+        ]
+
+    def share(self, *data) -> str:
+        """Write data for the tasks once, returns the key to pass instead."""
+        return save_shared(
+            os.path.join(self.directory, "data", uuid.uuid4().hex), *data
+        )
+
+    def submit(self, function, *args, cost: float = 1.0) -> Future:
+        """Queue function(*args), tasks with a larger cost are claimed first."""
+        future = Future()
+        task_id = uuid.uuid4().hex
+        # file names sort by decreasing cost
+        priority = max(0.0, 999.0 - math.log2(1.0 + max(cost, 0.0)))
+        name = f"{priority:010.5f}-{task_id}.task"
+        with self.lock:
+            self.futures[task_id] = future
+        _publish(
+            os.path.join(self.directory, "tasks", name),
+            lambda outfile: pickle.dump((function, args), outfile),
+        )
+        return future
+
+    def _collect(self):
+        """Hand the results to their futures, requeue abandoned tasks."""
+        results = os.path.join(self.directory, "results")
+        while not self.stopping.is_set():
+            for name in os.listdir(results):
+                if not name.endswith(".result"):
+                    continue
+                path = os.path.join(results, name)
+                with open(path, "rb") as infile:
+                    status, value = pickle.load(infile)
+                os.remove(path)
+                with self.lock:
+                    future = self.futures.pop(name[: -len(".result")], None)
+                # a task run twice after a requeue answers twice
+                if future is None:
+                    continue
+                if status == "ok":
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            self._requeue()
+            time.sleep(self.poll)
+
+    def _requeue(self):
+        claimed = os.path.join(self.directory, "claimed")
+        for name in os.listdir(claimed):
+            path = os.path.join(claimed, name)
+            try:
+                idle = time.time() - os.path.getmtime(path)
+                if idle > 3 * self.heartbeat:
+                    # <task name>.<worker>, back under its task name
+                    task = os.path.join(self.directory, "tasks", name.rsplit(".", 1)[0])
+                    os.rename(path, task)
+                    # renames keep the old time, the next claim starts fresh
+                    os.utime(task)
+            except OSError:
+                # finished or requeued meanwhile
+                pass
+
+    def shutdown(self):
+        with open(os.path.join(self.directory, "stop"), "w") as outfile:
+            outfile.write(socket.gethostname())
+        for process in self.processes:
+            process.wait()
+        self.stopping.set()
+        self.collector.join()
+        shutil.rmtree(os.path.join(self.directory, "data"), ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
+def worker(
+    directory: str,
+    blas_threads: int = 1,
+    heartbeat: float = 10.0,
+    poll: float = 0.2,
+) -> int:
+    """Claim and run tasks of a queue until its coordinator is done.
+
+    Parameters
+    ----------
+    directory: str :
+        The queue directory of a WorkQueue.
+
+    blas_threads: int :
+        BLAS and OpenMP threads of this process. (Default value = 1)
+
+    heartbeat: float :
+        Seconds between the touches of the running task, the same as the
+        coordinator's. (Default value = 10.0)
+
+    poll: float :
+        Seconds between looks for tasks when the queue is empty.
+        (Default value = 0.2)
+
+    Returns
+    -------
+    int
+        The number of tasks run.
+
+    Examples
+    --------
+    >>> worker("data/hp_queue", blas_threads=2)
+
+    """
+    threadpool_limits(limits=blas_threads)
+    tasks = os.path.join(directory, "tasks")
+    me = f"{socket.gethostname()}-{os.getpid()}"
+    done = 0
+    while not os.path.exists(os.path.join(directory, "stop")):
+        claimed = None
+        for name in sorted(os.listdir(tasks)):
+            if not name.endswith(".task"):
+                continue
+            path = os.path.join(directory, "claimed", f"{name}.{me}")
+            try:
+                os.rename(os.path.join(tasks, name), path)
+                os.utime(path)
+            except OSError:
+                # claimed by another worker first
+                continue
+            claimed = (name, path)
+            break
+        if claimed is None:
+            time.sleep(poll)
+            continue
+
+        name, path = claimed
+        running = threading.Event()
+        beat = threading.Thread(target=_beat, args=(path, heartbeat, running))
+        beat.start()
+        try:
+            with open(path, "rb") as infile:
+                function, args = pickle.load(infile)
+            answer = ("ok", function(*args))
+        except Exception as error:
+            answer = ("error", _picklable(error))
+        finally:
+            running.set()
+            beat.join()
+        task_id = name[: -len(".task")].split("-", 1)[1]
+        _publish(
+            os.path.join(directory, "results", f"{task_id}.result"),
+            lambda outfile: pickle.dump(answer, outfile),
+        )
+        try:
+            os.remove(path)
+        except OSError:
+            # requeued meanwhile, the coordinator ignores the second answer
+            pass
+        done += 1
+    return done
+
+
+def _beat(path: str, heartbeat: float, running: threading.Event):
+    """Touch a claimed task until it is finished."""
+    while not running.wait(heartbeat):
+        try:
+            os.utime(path)
+        except OSError:
+            return
+
+
+def _publish(path: str, write):
+    """Write a file under a temporary name, then rename it into place."""
+    partial = f"{path}.{socket.gethostname()}-{os.getpid()}.tmp"
+    with open(partial, "wb") as outfile:
+        write(outfile)
+    os.replace(partial, path)
+
+
+def _picklable(error: Exception) -> Exception:
+    """The exception, or its traceback if it cannot be pickled."""
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError("".join(traceback.format_exception(error)))
+
+
+def main():
+    """
+    this function will run a worker of a hyperparameter tuning work queue
+
+    Parameters:
+    -----------
+    queue: str
+        The queue directory, shared with the coordinator
+    blas_threads: int
+        BLAS threads of the worker
+    heartbeat: float
+        Seconds between the touches of the running task
+
+    Returns:
+    --------
+    None
+
+    Example:
+    --------
+    python work_queue.py data/hp_queue --blas_threads 1
+    """
+    parser = argparse.ArgumentParser(
+        description="Run hyperparameter tuning tasks from a work queue."
+    )
+    parser.add_argument("queue", type=str, help="The queue directory")
+    parser.add_argument(
+        "--blas_threads", type=int, default=1, help="BLAS threads of the worker"
+    )
+    parser.add_argument(
+        "--heartbeat",
+        type=float,
+        default=10.0,
+        help="Seconds between the touches of the running task",
+    )
+    args = parser.parse_args()
+    done = worker(args.queue, args.blas_threads, args.heartbeat)
+    print(f"Ran {done} tasks from {args.queue}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,12 @@ Functions:
 ----------
 load_data: Load the data from the file path.
 summary: Return the summary of the data.
+approximate_summary: Summary from mergeable sketches, for huge data.
 check_missing: Return the missing values in the data.
 encode_data: Encode the data.
+profile: Summary, missing values, duplicates and encoding in one pass.
+infer_dtypes: Pick compact dtypes for columns missing from the dtypes dict.
+memory_report: Memory per column before and after the compact dtypes.
 
 These functions will be run as a command line tool using argparse.
 
@@ -20,16 +24,60 @@ python cleandata.py check_missing --file_path data/original_data/insurance.csv
 python cleandata.py check_duplicate --file_path data/original_data/insurance.csv
 python cleandata.py encode_data --file_path data/original_data/insurance.csv
 
+Or all of the above in a single pass with a JSON report:
+python cleandata.py profile --file_path data/original_data/insurance.csv --version 000
+
+Add --chunksize to stream files that do not fit in memory, e.g.
+python cleandata.py summary --file_path data/original_data/insurance.csv --chunksize 100000
+
+Add --engine pyarrow to parse with the multithreaded Arrow CSV reader.
+
+--file_path can also be a directory or glob of CSV shards, which are parsed
+in a process pool and encoded into one parquet dataset:
+python cleandata.py encode_data --file_path "data/original_data/shards/*.csv" --version 000 --workers 8
+
+A summary of an encoded parquet file or dataset is answered from the footers:
+python cleandata.py summary --file_path data/transform/insurance_000.parquet
+python cleandata.py summary --file_path data/transform/insurance_000.parquet --columns bmi charges --stats count mean 50%
+
+Add --approximate for quantiles, unique counts and frequent values from
+fixed size sketches. The sketch of a parquet file is saved next to it:
+python cleandata.py summary --file_path data/transform/insurance_000.parquet --approximate
+
+Columns that are not in the dtypes dict get compact dtypes with --auto_dtypes,
+and the saving per column is printed by:
+python cleandata.py memory_report --file_path data/original_data/insurance.csv
+Floats only become float32 when exact, --float32_rtol 1e-6 accepts rounding.
+
+The parquet output can be partitioned and tuned, e.g.
+python cleandata.py encode_data --file_path data/original_data/insurance.csv --version 000 --partition_by region --row_group_size 100000 --compression zstd
+
+Add --incremental to encode_data to only encode rows appended since the last run:
+python cleandata.py encode_data --file_path data/original_data/insurance.csv --version 000 --incremental
+
 Or
 make clean_data if Makefile is available in your working directory."""
 
+import io
 import os
 import sys
+import json
+import glob
+import shutil
+import hashlib
 import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
 import sklearn
-from sklearn.preprocessing import LabelEncoder
+from pandas.api.types import union_categoricals
+from encoder import apply_encoder, fit_encoder, load_encoder, save_encoder
+from parquet_io import footer_summary, write_options
+from sketches import DataSketch, sketch_parquet
 
 
 # print versions of python, pandas, numpy and sklearn
@@ -51,8 +99,71 @@ dtypes = {
     "charges": np.float32,
 }
 
+# Columns that are label encoded by encode_data
+categorical_columns = ["sex", "smoker", "region"]
+
+
+def arrow_schema() -> pa.Schema:
+    """Map the dtypes dict onto an Arrow schema.
+
+    Category columns become dictionary encoded strings so they
+    arrive in pandas as categoricals without an object detour.
+
+    Returns
+    -------
+    pa.Schema
+        The Arrow schema of the data.
+
+    Examples
+    --------
+    >>> arrow_schema()
+
+    """
+    fields = []
+    for column, dtype in dtypes.items():
+        if dtype == "category":
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        elif dtype is object:
+            arrow_type = pa.string()
+        else:
+            arrow_type = pa.from_numpy_dtype(np.dtype(dtype))
+        fields.append(pa.field(column, arrow_type))
+    return pa.schema(fields)
+
 
-def load_data(file_path: str) -> pd.DataFrame:
+def list_shards(file_path: str) -> list:
+    """List the CSV files behind a path, a directory or a glob pattern.
+
+    Parameters
+    ----------
+    file_path: str :
+        A CSV file, a directory of CSV files or a glob such as
+        "data/original_data/insurance_*.csv".
+
+    Returns
+    -------
+    list
+        The CSV files in sorted order, which fixes the row order.
+
+    Examples
+    --------
+    >>> list_shards("data/original_data/shards")
+
+    """
+    if os.path.isdir(file_path):
+        shards = glob.glob(os.path.join(file_path, "*.csv"))
+    elif glob.has_magic(file_path):
+        shards = glob.glob(file_path)
+    else:
+        return [file_path]
+    if not shards:
+        raise FileNotFoundError(f"No CSV files match {file_path}")
+    return sorted(shards)
+
+
+def load_data(
+    file_path: str, chunksize: int = None, engine: str = "c", workers: int = None
+):
     """Load the data from the file path.
 
     Parameters
@@ -61,31 +172,327 @@ def load_data(file_path: str) -> pd.DataFrame:
         The path to the data file.
         To get more stable results use the absolute path.
         Or pathlib can be used to convert the relative path to absolute path.
+        A directory or glob of CSV shards is read in sorted order,
+        see list_shards.
+
+    chunksize: int :
+        Number of rows per chunk. When given, the file is streamed
+        and an iterator of typed DataFrames is returned instead,
+        so memory stays bounded by one chunk. (Default value = None)
+
+    engine: str :
+        "c" for the pandas C parser or "pyarrow" for the multithreaded
+        Arrow CSV reader. (Default value = "c")
+
+    workers: int :
+        Processes parsing shards in parallel when chunksize is not given.
+        (Default value = None, one per CPU)
 
 
     Returns
     -------
-    pd.DataFrame
+    pd.DataFrame or iterator of pd.DataFrame
         The data loaded from the file path.
 
     Examples
     --------
     >>> load_data("data/insurance.csv")
+    >>> load_data("data/insurance.csv", engine="pyarrow")
+    >>> for chunk in load_data("data/insurance.csv", chunksize=100_000):
+    ...     print(chunk.shape)
+    >>> load_data("data/original_data/insurance_*.csv", workers=8)
 
     """
+    shards = list_shards(file_path)
+    if len(shards) > 1:
+        return _load_shards(shards, chunksize, engine, workers)
     print(f"Loading data from {file_path}")
+    if engine == "pyarrow":
+        return _load_data_arrow(file_path, chunksize)
+    if engine != "c":
+        raise ValueError(f"Unknown engine {engine!r}, expected 'c' or 'pyarrow'")
+    if chunksize:
+        return pd.read_csv(file_path, dtype=dtypes, chunksize=chunksize)
     return pd.read_csv(file_path, dtype=dtypes)
 
 
-def summary(data: pd.DataFrame) -> pd.DataFrame:
+def _load_shards(shards: list, chunksize: int, engine: str, workers: int):
+    """Stream the shards one after another, or parse them in a process pool."""
+    if chunksize:
+        return (
+            chunk for shard in shards for chunk in load_data(shard, chunksize, engine)
+        )
+    frames = [None] * len(shards)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(load_data, shard, None, engine): index
+            for index, shard in enumerate(shards)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            frames[index] = future.result()
+            print(f"[{done}/{len(shards)}] {shards[index]}: {len(frames[index])} rows")
+    return _concat_frames(frames)
+
+
+def _concat_frames(frames: list) -> pd.DataFrame:
+    """Concatenate frames, keeping the category columns categorical."""
+    for column in frames[0].columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+            categories = union_categoricals(
+                [frame[column] for frame in frames], sort_categories=True
+            ).categories
+            for frame in frames:
+                frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _read_csv_chunks(file_path: str, chunksize: int, **kwargs):
+    """pd.read_csv in chunks over every shard of file_path."""
+    for shard in list_shards(file_path):
+        yield from pd.read_csv(shard, chunksize=chunksize, **kwargs)
+
+
+def _arrow_to_pandas(table: pa.Table) -> pd.DataFrame:
+    """Convert an Arrow table to pandas, releasing Arrow memory as it goes."""
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def _load_data_arrow(file_path: str, chunksize: int = None):
+    """Parse the file with the multithreaded Arrow CSV reader."""
+    read_options = pv.ReadOptions(use_threads=True)
+    convert_options = pv.ConvertOptions(column_types=arrow_schema())
+    if not chunksize:
+        table = pv.read_csv(
+            file_path, read_options=read_options, convert_options=convert_options
+        )
+        return _arrow_to_pandas(table)
+    return _iter_arrow_chunks(file_path, chunksize, read_options, convert_options)
+
+
+def _iter_arrow_chunks(file_path, chunksize, read_options, convert_options):
+    """Regroup the Arrow streaming reader's batches into chunks of chunksize rows."""
+    reader = pv.open_csv(
+        file_path, read_options=read_options, convert_options=convert_options
+    )
+    pending = []
+    pending_rows = 0
+    for batch in reader:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        while pending_rows >= chunksize:
+            table = pa.Table.from_batches(pending)
+            yield _arrow_to_pandas(table.slice(0, chunksize))
+            rest = table.slice(chunksize)
+            pending = rest.to_batches()
+            pending_rows = rest.num_rows
+    if pending_rows:
+        yield _arrow_to_pandas(pa.Table.from_batches(pending))
+
+
+def infer_dtypes(
+    file_path: str,
+    sample_rows: int = 10_000,
+    chunksize: int = 1_000_000,
+    float32_rtol: float = 0.0,
+) -> dict:
+    """Pick compact dtypes for the columns missing from the dtypes dict.
+
+    The smallest safe integer or float width, or category for low
+    cardinality strings, is proposed from the first sample_rows rows
+    and then checked against the whole file, one chunk at a time.
+    Where the full data does not fit the proposal the wider type wins.
+    Float columns only become float32 when every value survives the
+    round trip, unless a relative tolerance is given.
+
+    Parameters
+    ----------
+    file_path: str :
+        The path to the data file.
+
+    sample_rows: int :
+        Number of rows used to propose the dtypes. (Default value = 10_000)
+
+    chunksize: int :
+        Number of rows per chunk when verifying. (Default value = 1_000_000)
+
+    float32_rtol: float :
+        Relative error accepted when a float column is stored as float32.
+        (Default value = 0.0, exact values only)
+
+    Returns
+    -------
+    dict
+        Column name to dtype for the columns not in dtypes.
+
+    Examples
+    --------
+    >>> dtypes.update(infer_dtypes("data/insurance.csv"))
+
+    """
+    first = list_shards(file_path)[0]
+    header = pd.read_csv(first, nrows=0).columns
+    unknown = [column for column in header if column not in dtypes]
+    if not unknown:
+        return {}
+
+    sample = pd.read_csv(first, usecols=unknown, nrows=sample_rows)
+    proposed = {}
+    for column in unknown:
+        column_profile = _ColumnProfile(float32_rtol)
+        column_profile.update(sample[column])
+        proposed[column] = column_profile.dtype()
+
+    profiles = {column: _ColumnProfile(float32_rtol) for column in unknown}
+    for chunk in _read_csv_chunks(file_path, chunksize, usecols=unknown):
+        for column in unknown:
+            profiles[column].update(chunk[column])
+
+    inferred = {}
+    for column in unknown:
+        inferred[column] = profiles[column].dtype()
+        if str(inferred[column]) != str(proposed[column]):
+            print(
+                f"{column}: sample suggested {proposed[column]}, "
+                f"full data needs {inferred[column]}"
+            )
+    return inferred
+
+
+def memory_report(file_path: str, chunksize: int = 1_000_000) -> pd.DataFrame:
+    """Compare the memory of each column with and without the dtypes dict.
+
+    Parameters
+    ----------
+    file_path: str :
+        The path to the data file.
+
+    chunksize: int :
+        Number of rows per chunk. (Default value = 1_000_000)
+
+    Returns
+    -------
+    pd.DataFrame
+        Per column dtypes, bytes before and after and the saving.
+
+    Examples
+    --------
+    >>> memory_report("data/insurance.csv")
+
+    """
+    before = after = None
+    for chunk in _read_csv_chunks(file_path, chunksize):
+        compact = chunk.astype({c: t for c, t in dtypes.items() if c in chunk})
+        chunk_before = chunk.memory_usage(index=False, deep=True)
+        chunk_after = compact.memory_usage(index=False, deep=True)
+        before = chunk_before if before is None else before + chunk_before
+        after = chunk_after if after is None else after + chunk_after
+    report = pd.DataFrame(
+        {
+            "dtype before": chunk.dtypes.astype(str),
+            "dtype after": compact.dtypes.astype(str),
+            "MB before": before / 1e6,
+            "MB after": after / 1e6,
+        }
+    )
+    report.loc["total"] = ["", "", before.sum() / 1e6, after.sum() / 1e6]
+    report["saved %"] = 100 * (1 - report["MB after"] / report["MB before"])
+    return report.round(3)
+
+
+def collect_categories(file_path: str, chunksize: int = None) -> dict:
+    """Collect the sorted unique values of the categorical columns.
+
+    Only the categorical columns are parsed. The sorted values are
+    the same vocabularies fit_encoder learns from a full load.
+
+    Parameters
+    ----------
+    file_path: str :
+        The path to the data file.
+
+    chunksize: int :
+        Number of rows per chunk. (Default value = None)
+
+    Returns
+    -------
+    dict
+        Column name to sorted list of categories.
+
+    Examples
+    --------
+    >>> collect_categories("data/insurance.csv", chunksize=100_000)
+
+    """
+    reader = _read_csv_chunks(
+        file_path,
+        chunksize or 1_000_000,
+        usecols=categorical_columns,
+        dtype="category",
+    )
+    seen = {column: set() for column in categorical_columns}
+    for chunk in reader:
+        for column in categorical_columns:
+            seen[column].update(chunk[column].cat.categories)
+    return {column: sorted(values) for column, values in seen.items()}
+
+
+def get_vocabulary(
+    encoder_path: str, file_path: str = None, chunksize: int = None, data=None
+) -> dict:
+    """Load the saved encoder, or fit and save one if there is none yet.
+
+    Reusing the saved vocabularies keeps the codes stable when a new
+    file is encoded. Delete the encoder file to refit it.
+
+    Parameters
+    ----------
+    encoder_path: str :
+        The path of the encoder JSON file.
+
+    file_path: str :
+        The data file to fit the encoder on when data is not loaded.
+        (Default value = None)
+
+    chunksize: int :
+        Number of rows per chunk when fitting from file_path.
+        (Default value = None)
+
+    data: pd.DataFrame :
+        Loaded data to fit the encoder on. (Default value = None)
+
+    Returns
+    -------
+    dict
+        Column name to sorted list of values.
+
+    Examples
+    --------
+    >>> get_vocabulary("data/transform/encoder.json", "data/insurance.csv")
+
+    """
+    if os.path.exists(encoder_path):
+        print(f"Reusing encoder vocabularies from {encoder_path}")
+        return load_encoder(encoder_path)
+    if isinstance(data, pd.DataFrame):
+        vocabulary = fit_encoder(data, categorical_columns)
+    else:
+        vocabulary = collect_categories(file_path, chunksize)
+    save_encoder(vocabulary, encoder_path)
+    print(f"Encoder vocabularies saved to {encoder_path}")
+    return vocabulary
+
+
+def summary(data) -> pd.DataFrame:
     """Concise summary of the data.
     Packed with metric like count, mean, std, min, max
     of each column.
 
     Parameters
     ----------
-    data: pd.DataFrame :
-        The data to summarize.
+    data: pd.DataFrame or iterator of pd.DataFrame :
+        The data to summarize. Chunks are combined incrementally;
+        quantiles need the full column so they are left out.
 
 
     Returns
@@ -98,15 +505,49 @@ def summary(data: pd.DataFrame) -> pd.DataFrame:
     >>> summary(data)
     """
     print("Generating summary of the data")
-    return data.describe(include="all")
+    if isinstance(data, pd.DataFrame):
+        return data.describe(include="all")
+
+    stats = _SummaryStats()
+    for chunk in data:
+        stats.update(chunk)
+    return stats.result()
+
+
+def approximate_summary(data) -> pd.DataFrame:
+    """Summary of the data from mergeable sketches.
+
+    Memory is fixed per column however large the data is: quantiles
+    come from a t-digest, unique counts from a HyperLogLog and top/freq
+    from Misra-Gries counters. Count, mean, std, min and max are exact.
+
+    Parameters
+    ----------
+    data: pd.DataFrame or iterator of pd.DataFrame :
+        The data to summarize.
+
+    Returns
+    -------
+    pd.DataFrame
+        The approximate summary of the data.
+
+    Examples
+    --------
+    >>> approximate_summary(load_data(file_path, chunksize=1_000_000))
+    """
+    print("Generating approximate summary of the data")
+    sketch = DataSketch()
+    for chunk in [data] if isinstance(data, pd.DataFrame) else data:
+        sketch.update(chunk)
+    return sketch.summary()
 
 
-def check_missing(data: pd.DataFrame) -> pd.DataFrame:
+def check_missing(data) -> pd.DataFrame:
     """Check for missing values in the data.
 
     Parameters
     ----------
-    data: pd.DataFrame :
+    data: pd.DataFrame or iterator of pd.DataFrame :
         The data to check for missing values.
 
     Returns
@@ -120,16 +561,43 @@ def check_missing(data: pd.DataFrame) -> pd.DataFrame:
 
     """
     print("Checking for missing values in the data")
-    return data.isnull().sum()
+    if isinstance(data, pd.DataFrame):
+        return data.isnull().sum()
+
+    missing = _MissingCounts()
+    for chunk in data:
+        missing.update(chunk)
+    return missing.result()
 
 
-def check_duplicate(data: pd.DataFrame) -> pd.DataFrame:
+def check_duplicate(
+    data,
+    duplicates_path: str = None,
+    max_in_memory: int = 10_000_000,
+    reread=None,
+) -> pd.DataFrame:
     """Check for duplicate values in the data.
 
     Parameters
     ----------
-    data: pd.DataFrame :
+    data: pd.DataFrame or iterator of pd.DataFrame :
         The data to check for duplicate values.
+        Chunks are compared through 64-bit row hashes, which are
+        spilled to disk once more than max_in_memory rows are seen.
+        Rows with equal hashes are read again and compared by value.
+
+    duplicates_path: str :
+        Optional parquet file to write the row numbers of the
+        duplicates to, keeping the first occurrence. (Default value = None)
+
+    max_in_memory: int :
+        Number of row hashes kept in memory before spilling to disk.
+        (Default value = 10_000_000, about 160MB)
+
+    reread :
+        Function returning the chunks again, used to compare the rows
+        with equal hashes. (Default value = None, every chunk is kept
+        on disk until the end)
 
     Returns
     -------
@@ -139,24 +607,49 @@ def check_duplicate(data: pd.DataFrame) -> pd.DataFrame:
     Examples
     --------
     >>> check_duplicate(data)
+    >>> check_duplicate(chunks, duplicates_path="data/transform/duplicates.parquet")
+    >>> check_duplicate(chunks, reread=lambda: load_data(path, chunksize=100_000))
 
     """
     print("Checking for duplicate values in the data")
-    return data.duplicated().sum()
+    if isinstance(data, pd.DataFrame):
+        duplicated = data.duplicated()
+        if duplicates_path:
+            _save_duplicate_rows(np.flatnonzero(duplicated), duplicates_path)
+        return duplicated.sum()
+
+    duplicates = _DuplicateCounter(duplicates_path, max_in_memory, reread)
+    for chunk in data:
+        duplicates.update(chunk)
+    return duplicates.result()
 
 
-def encode_data(data: pd.DataFrame, version) -> pd.DataFrame:
+def encode_data(
+    data, version, vocabulary: dict = None, parquet_options: dict = None
+) -> pd.DataFrame:
     """Encode the data.
     That is, convert the categorical data to numerical data.
 
     Parameters
     ----------
-    data: pd.DataFrame :
-        The data to encode.
+    data: pd.DataFrame or iterator of pd.DataFrame :
+        The data to encode. Chunks are encoded one at a time and
+        appended to the parquet file as row groups.
 
     version: str :
         The version of the data to save.
 
+    vocabulary: dict :
+        Sorted values per categorical column, see get_vocabulary.
+        Values outside the vocabulary get encoder.UNSEEN_CODE.
+        Fitted on data when not given, which is only possible when
+        data is a DataFrame. (Default value = None)
+
+    parquet_options: dict :
+        Partitioning, row group size, compression, dictionary and
+        statistics options, see parquet_io.write_options.
+        (Default value = None, pyarrow defaults)
+
     Returns
     -------
     type
@@ -168,20 +661,779 @@ def encode_data(data: pd.DataFrame, version) -> pd.DataFrame:
     >>> encode_data(data)
 
     """
-    label_encoder = LabelEncoder()
-    data["sex"] = label_encoder.fit_transform(data["sex"])
-    data["smoker"] = label_encoder.fit_transform(data["smoker"])
-    data["region"] = label_encoder.fit_transform(data["region"])
+    if not isinstance(data, pd.DataFrame):
+        return _encode_chunks(data, version, vocabulary, parquet_options)
+
+    if vocabulary is None:
+        vocabulary = fit_encoder(data, categorical_columns)
+    apply_encoder(data, vocabulary)
     # make a transform directory if it does not exist
     if not os.path.exists("data/transform"):
         os.makedirs("data/transform")
+    # partitioned and incremental runs leave a directory at the same path
+    _remove_output(f"data/transform/insurance_{version}.parquet")
     print("label encoding sex, smoker, and region columns")
-    data.to_parquet(f"data/transform/insurance_{version}.parquet")  # more efficient
+    data.to_parquet(
+        f"data/transform/insurance_{version}.parquet", **(parquet_options or {})
+    )  # more efficient
     # data.to_pickle(f"data/transform/insurance_{version}.pkl") # less efficient
     # data.to_csv(f"data/transform/insurance_{version}.csv") # less efficient
     return data.transpose()
 
 
+def _remove_output(path: str):
+    """Remove a previous parquet file or dataset directory."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _encode_chunks(
+    chunks, version, vocabulary: dict, parquet_options: dict = None
+) -> pd.DataFrame:
+    """Encode chunks with a fixed vocabulary and stream them to parquet."""
+    print("label encoding sex, smoker, and region columns chunk by chunk")
+    _remove_output(f"data/transform/insurance_{version}.parquet")
+    writer = _EncodedWriter(version, vocabulary, parquet_options=parquet_options)
+    try:
+        for chunk in chunks:
+            writer.update(chunk)
+    finally:
+        writer.close()
+    return writer.result()
+
+
+def encode_shards(
+    file_path: str,
+    version,
+    vocabulary: dict,
+    chunksize: int = None,
+    parquet_options: dict = None,
+    engine: str = "c",
+    workers: int = None,
+) -> pd.DataFrame:
+    """Encode CSV shards in a process pool into one parquet dataset.
+
+    Each worker streams one shard in chunks, so its memory is bounded
+    by one chunk, and writes it to its own part file. Part files are
+    numbered by the sorted shard order, so reading the dataset back
+    gives the same row order on every run.
+
+    Parameters
+    ----------
+    file_path: str :
+        A directory or glob of CSV shards, see list_shards.
+
+    version: str :
+        The version of the data to save.
+
+    vocabulary: dict :
+        Sorted values per categorical column, see get_vocabulary.
+
+    chunksize: int :
+        Number of rows per chunk in each worker. (Default value = None)
+
+    parquet_options: dict :
+        Options of the parquet output, see parquet_io.write_options.
+        (Default value = None)
+
+    engine: str :
+        CSV parser, see load_data. (Default value = "c")
+
+    workers: int :
+        Number of worker processes. (Default value = None, one per CPU)
+
+    Returns
+    -------
+    pd.DataFrame
+        The path, the number of shards and the rows written.
+
+    Examples
+    --------
+    >>> encode_shards("data/original_data/shards", "000", vocabulary, 100_000)
+
+    """
+    shards = list_shards(file_path)
+    path = f"data/transform/insurance_{version}.parquet"
+    _remove_output(path)
+    os.makedirs(path)
+    print(f"label encoding {len(shards)} shards into {path}")
+    rows = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(
+                _encode_shard,
+                index,
+                shard,
+                path,
+                vocabulary,
+                chunksize,
+                parquet_options,
+                engine,
+            ): shard
+            for index, shard in enumerate(shards)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            shard_rows = future.result()
+            rows += shard_rows
+            print(f"[{done}/{len(shards)}] {futures[future]}: {shard_rows} rows")
+    return pd.DataFrame(
+        {"path": [path], "shards": [len(shards)], "rows": [rows]}
+    ).transpose()
+
+
+def _encode_shard(
+    index, shard, path, vocabulary, chunksize, parquet_options, engine
+) -> int:
+    """Encode one shard in a worker process, one chunk at a time."""
+    prefix = f"shard-{index:05d}-"
+    if not (parquet_options or {}).get("partition_cols"):
+        path = os.path.join(path, f"{prefix}part.parquet")
+    writer = _EncodedWriter(None, vocabulary, path, parquet_options, prefix)
+    try:
+        for chunk in load_data(shard, chunksize or 1_000_000, engine):
+            writer.update(chunk)
+    finally:
+        writer.close()
+    return writer.rows
+
+
+def encode_incremental(
+    file_path: str,
+    version,
+    vocabulary: dict,
+    chunksize: int = None,
+    parquet_options: dict = None,
+) -> pd.DataFrame:
+    """Encode only the rows appended to the file since the last run.
+
+    The output is a directory of parquet parts at
+    data/transform/insurance_{version}.parquet, which pandas reads like
+    a single file. A watermark next to it stores the byte offset that
+    has been encoded and a SHA-256 of the file up to that offset. When
+    the prefix still hashes the same only the tail is parsed and encoded
+    with the saved vocabulary into a new part. Otherwise the whole file
+    is rebuilt. A trailing partial line is left for the next run.
+
+    Parameters
+    ----------
+    file_path: str :
+        The path to the data file.
+
+    version: str :
+        The version of the data to save.
+
+    vocabulary: dict :
+        Sorted values per categorical column, see get_vocabulary.
+
+    chunksize: int :
+        Number of rows per chunk when parsing. (Default value = None)
+
+    parquet_options: dict :
+        Row group size, compression, dictionary and statistics options,
+        see parquet_io.write_options. Partitioning is not supported
+        since every run adds one part file. (Default value = None)
+
+    Returns
+    -------
+    pd.DataFrame
+        The path, the rows added and the total rows.
+
+    Examples
+    --------
+    >>> encode_incremental("data/insurance.csv", "000", vocabulary)
+
+    """
+    if parquet_options and parquet_options.get("partition_cols"):
+        raise ValueError("incremental encoding does not support partitioning")
+    if len(list_shards(file_path)) > 1:
+        raise ValueError("incremental encoding needs a single CSV file")
+    path = f"data/transform/insurance_{version}.parquet"
+    watermark_path = f"data/transform/insurance_{version}.watermark.json"
+    watermark = None
+    if os.path.isdir(path) and os.path.exists(watermark_path):
+        with open(watermark_path, "r") as infile:
+            watermark = json.load(infile)
+
+    with open(file_path, "rb") as infile:
+        header = infile.readline()
+        end = _last_complete_line(infile)
+        prefix_ok, digest = _hash_prefix(infile, end, watermark)
+        if prefix_ok and watermark["header"] == header.decode():
+            offset, parts, rows = (
+                watermark["offset"],
+                watermark["parts"],
+                watermark["rows"],
+            )
+            print(f"Encoding rows appended after byte {offset}")
+        else:
+            if watermark:
+                print("The file changed before the watermark, rebuilding")
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+            offset, parts, rows = len(header), [], 0
+
+        added = 0
+        if end > offset:
+            infile.seek(offset)
+            columns = pd.read_csv(io.BytesIO(header), nrows=0).columns.tolist()
+            tail = io.BufferedReader(_ByteRange(infile, end))
+            chunks = pd.read_csv(
+                tail,
+                header=None,
+                names=columns,
+                dtype=dtypes,
+                chunksize=chunksize or 1_000_000,
+            )
+            part = f"part-{len(parts):05d}.parquet"
+            writer = _EncodedWriter(
+                version, vocabulary, os.path.join(path, part), parquet_options
+            )
+            try:
+                for chunk in chunks:
+                    writer.update(chunk)
+            finally:
+                writer.close()
+            added = writer.rows
+            parts.append(part)
+
+    os.makedirs(path, exist_ok=True)
+    with open(watermark_path, "w") as outfile:
+        json.dump(
+            {
+                "offset": end,
+                "sha256": digest,
+                "header": header.decode(),
+                "parts": parts,
+                "rows": rows + added,
+            },
+            outfile,
+            indent=2,
+        )
+    print(f"Encoded {added} new rows, {rows + added} rows in {path}")
+    return pd.DataFrame(
+        {"path": [path], "rows_added": [added], "rows": [rows + added]}
+    ).transpose()
+
+
+def _last_complete_line(infile) -> int:
+    """Return the byte offset just after the last newline of the file."""
+    end = infile.seek(0, os.SEEK_END)
+    while end > 0:
+        start = max(0, end - 65536)
+        infile.seek(start)
+        block = infile.read(end - start)
+        newline = block.rfind(b"\n")
+        if newline >= 0:
+            return start + newline + 1
+        end = start
+    return 0
+
+
+def _hash_prefix(infile, end: int, watermark: dict = None):
+    """SHA-256 of the file up to end, checking the watermark on the way.
+
+    Returns whether the digest of the first watermark["offset"] bytes
+    matches the watermark, and the digest of the first end bytes.
+    """
+    digest = hashlib.sha256()
+    stops = [end]
+    if watermark and watermark["offset"] <= end:
+        stops.insert(0, watermark["offset"])
+    prefix_ok = False
+    position = infile.seek(0)
+    for stop in stops:
+        while position < stop:
+            block = infile.read(min(1 << 24, stop - position))
+            if not block:
+                break
+            digest.update(block)
+            position += len(block)
+        if watermark and stop == watermark["offset"]:
+            prefix_ok = digest.hexdigest() == watermark["sha256"]
+    return prefix_ok, digest.hexdigest()
+
+
+class _ByteRange(io.RawIOBase):
+    """Readable view of a file that stops at a fixed byte offset."""
+
+    def __init__(self, infile, end: int):
+        self.infile = infile
+        self.end = end
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.end - self.infile.tell())
+        if size <= 0:
+            return 0
+        data = self.infile.read(size)
+        buffer[: len(data)] = data
+        return len(data)
+
+
+class _ColumnProfile:
+    """Range, precision and cardinality of one column, updated per chunk."""
+
+    integer_types = [np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32]
+    max_categories = 1000
+    category_ratio = 0.5
+
+    def __init__(self, float32_rtol: float = 0.0):
+        self.float32_rtol = float32_rtol
+        self.numeric = True
+        self.boolean = True
+        self.integral = True
+        self.has_nan = False
+        self.float32_ok = True
+        self.low, self.high = np.inf, -np.inf
+        self.count = 0
+        self.uniques = set()
+
+    def update(self, values: pd.Series):
+        missing = int(values.isna().sum())
+        values = values.dropna()
+        self.count += len(values)
+        if len(self.uniques) <= self.max_categories:
+            self.uniques.update(values.unique().tolist())
+        if not (self.numeric and pd.api.types.is_numeric_dtype(values)):
+            self.numeric = False
+            return
+        self.boolean &= pd.api.types.is_bool_dtype(values)
+        # integers cannot hold missing values, so those columns stay float
+        self.has_nan |= missing > 0
+        numbers = values.to_numpy(dtype=np.float64)
+        if not len(numbers):
+            return
+        self.low = min(self.low, numbers.min())
+        self.high = max(self.high, numbers.max())
+        self.integral &= bool((numbers == np.round(numbers)).all())
+        with np.errstate(over="ignore"):
+            rounded = numbers.astype(np.float32).astype(np.float64)
+        if self.float32_rtol:
+            exact = np.allclose(rounded, numbers, rtol=self.float32_rtol, atol=0)
+        else:
+            exact = (rounded == numbers).all()
+        self.float32_ok &= bool(exact)
+
+    def dtype(self):
+        if self.numeric and self.boolean and not self.has_nan:
+            return np.bool_
+        if self.numeric and self.integral and not self.has_nan:
+            for integer_type in self.integer_types:
+                info = np.iinfo(integer_type)
+                if info.min <= self.low and self.high <= info.max:
+                    return integer_type
+            return np.int64
+        if self.numeric:
+            return np.float32 if self.float32_ok else np.float64
+        few = len(self.uniques) <= self.max_categories
+        if few and len(self.uniques) <= self.category_ratio * self.count:
+            return "category"
+        return object
+
+
+class _SummaryStats:
+    """Running describe() statistics, updated one chunk at a time."""
+
+    rows = ["count", "unique", "top", "freq", "mean", "std", "min", "max"]
+
+    def __init__(self):
+        self.columns = []
+        self.numeric = {}
+        self.counts = {}
+
+    def update(self, chunk: pd.DataFrame):
+        self.columns = self.columns or list(chunk.columns)
+        for column in chunk.columns:
+            values = chunk[column]
+            if pd.api.types.is_numeric_dtype(values):
+                self._update_numeric(column, values.dropna().astype(np.float64))
+            else:
+                value_counts = values.value_counts()
+                self.counts[column] = (
+                    value_counts
+                    if column not in self.counts
+                    else self.counts[column].add(value_counts, fill_value=0)
+                )
+
+    def _update_numeric(self, column, values: pd.Series):
+        stats = self.numeric.setdefault(column, [0, 0.0, 0.0, np.inf, -np.inf])
+        n = len(values)
+        if not n:
+            return
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        # Chan et al. parallel update of count, mean and M2
+        total = stats[0] + n
+        delta = mean - stats[1]
+        stats[1] += delta * n / total
+        stats[2] += m2 + delta**2 * stats[0] * n / total
+        stats[0] = total
+        stats[3] = min(stats[3], values.min())
+        stats[4] = max(stats[4], values.max())
+
+    def result(self) -> pd.DataFrame:
+        result = {}
+        for column, (n, mean, m2, low, high) in self.numeric.items():
+            result[column] = {
+                "count": n,
+                "mean": mean if n else np.nan,
+                "std": np.sqrt(m2 / (n - 1)) if n > 1 else np.nan,
+                "min": low if n else np.nan,
+                "max": high if n else np.nan,
+            }
+        for column, value_counts in self.counts.items():
+            value_counts = value_counts[value_counts > 0]
+            result[column] = {
+                "count": int(value_counts.sum()),
+                "unique": len(value_counts),
+                "top": value_counts.idxmax() if len(value_counts) else np.nan,
+                "freq": int(value_counts.max()) if len(value_counts) else np.nan,
+            }
+        return pd.DataFrame(result).reindex(index=self.rows, columns=self.columns)
+
+
+class _MissingCounts:
+    """Running count of missing values per column."""
+
+    def __init__(self):
+        self.missing = None
+
+    def update(self, chunk: pd.DataFrame):
+        chunk_missing = chunk.isnull().sum()
+        self.missing = (
+            chunk_missing if self.missing is None else self.missing + chunk_missing
+        )
+
+    def result(self) -> pd.Series:
+        return self.missing
+
+
+class _DuplicateCounter:
+    """Exact duplicate row detection across chunks using 64-bit row hashes.
+
+    Row hashes and row numbers are buffered in flat numpy arrays. Once
+    max_in_memory rows are buffered they are partitioned on the top
+    byte of the hash and appended to bucket files on disk, so only one
+    bucket has to be loaded when the duplicates are resolved.
+
+    Equal hashes only make rows candidates. The rows sharing a hash are
+    flagged, the chunks are read once more, and only the flagged rows of
+    the chunks holding some are written to disk, split by hash bucket.
+    Each bucket's rows are then compared by value on their own, so a
+    hash collision is never counted as a duplicate and memory is bound
+    by one bucket of candidates.
+    """
+
+    record = np.dtype([("hash", np.uint64), ("row", np.int64)])
+    n_buckets = 256
+
+    def __init__(
+        self,
+        duplicates_path: str = None,
+        max_in_memory: int = 10_000_000,
+        reread=None,
+    ):
+        self.duplicates_path = duplicates_path
+        self.max_in_memory = max_in_memory
+        self.reread = reread
+        self.buffer = []
+        self.buffered = 0
+        self.rows = 0
+        self.spilled = False
+        self.kept = []
+        self.spill_dir = None
+
+    def update(self, chunk: pd.DataFrame):
+        if self.reread is None:
+            # a one shot iterator, kept to be read again
+            path = os.path.join(self._directory(), f"chunk_{len(self.kept):06d}.pkl")
+            chunk.to_pickle(path)
+            self.kept.append(path)
+        records = np.empty(len(chunk), dtype=self.record)
+        records["hash"] = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        records["row"] = np.arange(self.rows, self.rows + len(chunk))
+        self.rows += len(chunk)
+        self.buffer.append(records)
+        self.buffered += len(records)
+        if self.buffered >= self.max_in_memory:
+            self._spill()
+
+    def _directory(self) -> str:
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="check_duplicate_")
+        return self.spill_dir
+
+    def _spill(self):
+        self._directory()
+        self.spilled = True
+        records = np.concatenate(self.buffer)
+        self.buffer, self.buffered = [], 0
+        buckets = self._bucket(records["hash"])
+        # stable so rows stay in file order inside each bucket
+        order = np.argsort(buckets, kind="stable")
+        records, buckets = records[order], buckets[order]
+        bounds = np.searchsorted(buckets, np.arange(self.n_buckets + 1))
+        for bucket in range(self.n_buckets):
+            start, stop = bounds[bucket], bounds[bucket + 1]
+            if start < stop:
+                with open(self._bucket_path(bucket), "ab") as outfile:
+                    records[start:stop].tofile(outfile)
+
+    def _bucket(self, hashes: np.ndarray) -> np.ndarray:
+        return (hashes >> np.uint64(56)).astype(np.int64)
+
+    def _bucket_path(self, bucket: int) -> str:
+        return os.path.join(self.spill_dir, f"bucket_{bucket:03d}.bin")
+
+    @staticmethod
+    def _candidate_rows(records: np.ndarray) -> np.ndarray:
+        # every row whose hash is shared with another row
+        hashes = np.sort(records["hash"])
+        shared = hashes[1:][hashes[1:] == hashes[:-1]]
+        return records["row"][np.isin(records["hash"], shared)]
+
+    def _flag_candidates(self) -> np.ndarray:
+        """One flag per row, set for the rows whose hash is shared."""
+        if not self.spilled:
+            flags = np.zeros(self.rows, dtype=bool)
+            if self.buffer:
+                flags[self._candidate_rows(np.concatenate(self.buffer))] = True
+            return flags
+        if self.buffer:
+            self._spill()
+        # one byte per row on disk rather than in memory
+        flags = np.memmap(
+            os.path.join(self.spill_dir, "candidates.bin"),
+            dtype=bool,
+            mode="w+",
+            shape=(max(self.rows, 1),),
+        )
+        for bucket in range(self.n_buckets):
+            path = self._bucket_path(bucket)
+            if os.path.exists(path):
+                records = np.fromfile(path, dtype=self.record)
+                flags[self._candidate_rows(records)] = True
+                os.remove(path)
+        return flags
+
+    def _spill_candidates(self, flags: np.ndarray) -> set:
+        """Write the flagged rows of every chunk by bucket, returns the buckets."""
+        chunks = self.reread() if self.reread else map(pd.read_pickle, self.kept)
+        buckets, start = set(), 0
+        for i, chunk in enumerate(chunks):
+            selected = np.flatnonzero(flags[start : start + len(chunk)])
+            if len(selected):
+                candidates = chunk.iloc[selected].set_axis(start + selected, axis=0)
+                hashes = pd.util.hash_pandas_object(candidates, index=False)
+                bucket_ids = self._bucket(hashes.to_numpy())
+                for bucket in np.unique(bucket_ids):
+                    path = os.path.join(
+                        self.spill_dir, f"rows_{bucket:03d}_{i:06d}.pkl"
+                    )
+                    candidates[bucket_ids == bucket].to_pickle(path)
+                    buckets.add(int(bucket))
+            start += len(chunk)
+        return buckets
+
+    def result(self) -> int:
+        flags = self._flag_candidates()
+        parts = []
+        if flags.any():
+            self._directory()
+            for bucket in sorted(self._spill_candidates(flags)):
+                # chunk files sort in file order, so the first row is kept
+                paths = sorted(
+                    glob.glob(os.path.join(self.spill_dir, f"rows_{bucket:03d}_*.pkl"))
+                )
+                frame = pd.concat([pd.read_pickle(path) for path in paths])
+                parts.append(frame.index.to_numpy()[frame.duplicated().to_numpy()])
+                for path in paths:
+                    os.remove(path)
+        del flags
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir)
+            self.spill_dir = None
+        rows = np.sort(np.concatenate(parts)) if parts else np.empty(0, np.int64)
+        if self.duplicates_path:
+            _save_duplicate_rows(rows, self.duplicates_path)
+        return len(rows)
+
+
+def _save_duplicate_rows(rows: np.ndarray, duplicates_path: str):
+    """Write the row numbers of duplicate rows to a parquet file."""
+    os.makedirs(os.path.dirname(duplicates_path) or ".", exist_ok=True)
+    pd.DataFrame({"row": rows.astype(np.int64)}).to_parquet(duplicates_path)
+    print(f"Duplicate row numbers written to {duplicates_path}")
+
+
+class _EncodedWriter:
+    """Label encode chunks with a fixed vocabulary and append them to parquet."""
+
+    def __init__(
+        self,
+        version,
+        vocabulary: dict,
+        path: str = None,
+        parquet_options: dict = None,
+        prefix: str = "",
+    ):
+        if vocabulary is None:
+            raise ValueError("a vocabulary is required to encode chunks consistently")
+        self.path = path or f"data/transform/insurance_{version}.parquet"
+        self.prefix = prefix
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.vocabulary = vocabulary
+        options = dict(parquet_options or {})
+        self.partition_cols = options.pop("partition_cols", None)
+        self.row_group_size = options.pop("row_group_size", None)
+        self.file_options = options
+        self.writer = None
+        self.chunks = 0
+        self.rows = 0
+
+    def update(self, chunk: pd.DataFrame):
+        chunk = apply_encoder(chunk.copy(), self.vocabulary)
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if self.partition_cols:
+            # one file per chunk in every partition directory
+            pq.write_to_dataset(
+                table,
+                self.path,
+                partition_cols=self.partition_cols,
+                basename_template=f"{self.prefix}part-{self.chunks:05d}-{{i}}.parquet",
+                row_group_size=self.row_group_size,
+                **self.file_options,
+            )
+        else:
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(
+                    self.path, table.schema, **self.file_options
+                )
+            self.writer.write_table(table, row_group_size=self.row_group_size)
+        self.chunks += 1
+        self.rows += len(chunk)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def result(self) -> pd.DataFrame:
+        return pd.DataFrame({"path": [self.path], "rows": [self.rows]}).transpose()
+
+
+def profile(
+    file_path: str,
+    version,
+    chunksize: int = None,
+    report: str = None,
+    engine: str = "c",
+    duplicates_path: str = None,
+    encoder_path: str = "data/transform/encoder.json",
+    parquet_options: dict = None,
+) -> dict:
+    """Profile and encode the data in a single pass over the file.
+
+    Computes the summary, missing values, duplicate count and the
+    encoded parquet file from one parse of the CSV and writes them
+    to a JSON report. With chunksize only the categorical columns
+    are read beforehand to fix the encoding.
+
+    Parameters
+    ----------
+    file_path: str :
+        The path to the data file.
+
+    version: str :
+        The version of the data to save.
+
+    chunksize: int :
+        Number of rows per chunk. (Default value = None)
+
+    report: str :
+        Path of the JSON report.
+        (Default value = None, data/transform/profile_{version}.json)
+
+    engine: str :
+        CSV parser, see load_data. (Default value = "c")
+
+    duplicates_path: str :
+        Optional parquet file for the duplicate row numbers,
+        see check_duplicate. (Default value = None)
+
+    encoder_path: str :
+        The encoder JSON file, reused when it exists, see get_vocabulary.
+        (Default value = "data/transform/encoder.json")
+
+    parquet_options: dict :
+        Options of the encoded parquet output, see parquet_io.write_options.
+        (Default value = None)
+
+    Returns
+    -------
+    dict
+        The report.
+
+    Examples
+    --------
+    >>> profile("data/insurance.csv", "000")
+
+    """
+    report = report or f"data/transform/profile_{version}.json"
+    data = load_data(file_path, chunksize, engine)
+    if isinstance(data, pd.DataFrame):
+        rows = len(data)
+        data_summary = summary(data)
+        missing = check_missing(data)
+        duplicates = check_duplicate(data, duplicates_path)
+        vocabulary = get_vocabulary(encoder_path, data=data)
+        encode_data(data, version, vocabulary, parquet_options)
+        encoded_path = f"data/transform/insurance_{version}.parquet"
+    else:
+        print("Profiling the data chunk by chunk")
+        accumulators = [
+            _SummaryStats(),
+            _MissingCounts(),
+            _DuplicateCounter(
+                duplicates_path,
+                reread=lambda: load_data(file_path, chunksize, engine),
+            ),
+        ]
+        vocabulary = get_vocabulary(encoder_path, file_path, chunksize)
+        _remove_output(f"data/transform/insurance_{version}.parquet")
+        writer = _EncodedWriter(version, vocabulary, parquet_options=parquet_options)
+        try:
+            for chunk in data:
+                for accumulator in accumulators:
+                    accumulator.update(chunk)
+                writer.update(chunk)
+        finally:
+            writer.close()
+        data_summary, missing, duplicates = [a.result() for a in accumulators]
+        rows, encoded_path = writer.rows, writer.path
+
+    result = {
+        "file_path": file_path,
+        "version": version,
+        "rows": int(rows),
+        "summary": json.loads(data_summary.to_json()),
+        "missing": {column: int(n) for column, n in missing.items()},
+        "duplicates": int(duplicates),
+        "encoded_path": encoded_path,
+        "encoder_path": encoder_path,
+    }
+    os.makedirs(os.path.dirname(report) or ".", exist_ok=True)
+    with open(report, "w") as outfile:
+        json.dump(result, outfile, indent=2)
+    print(f"Profile report written to {report}")
+    return result
+
+
 def main():
     """Convert this to a command line tool with argparse.
     This function is the entry point for the command line tool.
@@ -199,29 +1451,201 @@ def main():
             "check_missing",
             "check_duplicate",
             "encode_data",
+            "profile",
+            "memory_report",
         ],
     )
-    parser.add_argument("--file_path", help="The path to the data file")
+    parser.add_argument(
+        "--file_path",
+        help="The path to the data file, or a directory or glob of CSV shards",
+    )
     parser.add_argument("--version", help="The version of the data to save")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="encode_data: only encode rows appended since the last run",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        help="Stream the file in chunks of this many rows to bound memory",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["c", "pyarrow"],
+        default="c",
+        help="CSV parser: pandas C parser or multithreaded pyarrow reader",
+    )
+    parser.add_argument(
+        "--duplicates_path",
+        help="Parquet file to write the row numbers of duplicate rows to",
+    )
+    parser.add_argument(
+        "--encoder_path",
+        default="data/transform/encoder.json",
+        help="Encoder vocabularies, reused when the file exists",
+    )
+    parser.add_argument(
+        "--report",
+        help="Path of the profile JSON report (default data/transform/profile_{version}.json)",
+    )
+
+    parser.add_argument(
+        "--columns", nargs="+", help="summary of a parquet file: columns to include"
+    )
+    parser.add_argument(
+        "--stats",
+        nargs="+",
+        help="summary of a parquet file: count, missing, min and max come from "
+        "the footers, mean, std and quantiles like 50%% read the columns",
+    )
+    parser.add_argument(
+        "--approximate",
+        action="store_true",
+        help="summary: approximate quantiles, unique counts and frequent values "
+        "from sketches, cached next to a parquet file",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Processes used to parse a directory or glob of CSV shards",
+    )
+    parser.add_argument(
+        "--auto_dtypes",
+        action="store_true",
+        help="Infer compact dtypes for columns missing from the dtypes dict",
+    )
+    parser.add_argument(
+        "--float32_rtol",
+        type=float,
+        default=0.0,
+        help="Relative error accepted when --auto_dtypes stores floats as float32",
+    )
+    parser.add_argument(
+        "--partition_by",
+        nargs="+",
+        help="Write the encoded data as a dataset partitioned by these columns",
+    )
+    parser.add_argument(
+        "--row_group_size", type=int, help="Maximum rows per parquet row group"
+    )
+    parser.add_argument(
+        "--compression",
+        choices=["snappy", "zstd", "gzip", "brotli", "lz4", "none"],
+        default="snappy",
+        help="Parquet compression codec",
+    )
+    parser.add_argument(
+        "--compression_level", type=int, help="Codec specific compression level"
+    )
+    parser.add_argument(
+        "--no_dictionary",
+        action="store_true",
+        help="Disable parquet dictionary encoding",
+    )
+    parser.add_argument(
+        "--no_statistics",
+        action="store_true",
+        help="Do not write parquet column statistics",
+    )
 
     # Parse the arguments:
     args = parser.parse_args()
+    options = write_options(
+        args.partition_by,
+        args.row_group_size,
+        args.compression,
+        args.compression_level,
+        not args.no_dictionary,
+        not args.no_statistics,
+    )
+
+    if args.auto_dtypes or args.command == "memory_report":
+        dtypes.update(
+            infer_dtypes(
+                args.file_path,
+                chunksize=args.chunksize or 1_000_000,
+                float32_rtol=args.float32_rtol,
+            )
+        )
 
     # Check the command and call the appropriate function
     if args.command == "load_data":
-        print(load_data(args.file_path))
+        data = load_data(args.file_path, args.chunksize, args.engine, args.workers)
+        if args.chunksize:
+            for i, chunk in enumerate(data):
+                print(f"chunk {i}: {chunk.shape[0]} rows, {chunk.shape[1]} columns")
+        else:
+            print(data)
+    elif args.command == "summary" and args.approximate:
+        if args.file_path.endswith(".parquet"):
+            print(sketch_parquet(args.file_path, args.workers).summary())
+        else:
+            data = load_data(
+                args.file_path, args.chunksize or 1_000_000, args.engine, args.workers
+            )
+            print(approximate_summary(data))
+    elif args.command == "summary" and args.file_path.endswith(".parquet"):
+        print(footer_summary(args.file_path, args.columns, args.stats))
     elif args.command == "summary":
-        data = load_data(args.file_path)
+        data = load_data(args.file_path, args.chunksize, args.engine, args.workers)
         print(summary(data))
     elif args.command == "check_missing":
-        data = load_data(args.file_path)
+        data = load_data(args.file_path, args.chunksize, args.engine, args.workers)
         print(check_missing(data))
+    elif args.command == "encode_data" and args.incremental:
+        vocabulary = get_vocabulary(args.encoder_path, args.file_path, args.chunksize)
+        print(
+            encode_incremental(
+                args.file_path, args.version, vocabulary, args.chunksize, options
+            )
+        )
+    elif args.command == "encode_data" and len(list_shards(args.file_path)) > 1:
+        vocabulary = get_vocabulary(args.encoder_path, args.file_path, args.chunksize)
+        print(
+            encode_shards(
+                args.file_path,
+                args.version,
+                vocabulary,
+                args.chunksize,
+                options,
+                args.engine,
+                args.workers,
+            )
+        )
     elif args.command == "encode_data":
-        data = load_data(args.file_path)
-        print(encode_data(data, args.version))
+        data = load_data(args.file_path, args.chunksize, args.engine, args.workers)
+        if args.chunksize:
+            vocabulary = get_vocabulary(
+                args.encoder_path, args.file_path, args.chunksize
+            )
+        else:
+            vocabulary = get_vocabulary(args.encoder_path, data=data)
+        print(encode_data(data, args.version, vocabulary, options))
     elif args.command == "check_duplicate":
-        data = load_data(args.file_path)
-        print(check_duplicate(data))
+        data = load_data(args.file_path, args.chunksize, args.engine, args.workers)
+        print(
+            check_duplicate(
+                data,
+                args.duplicates_path,
+                reread=lambda: load_data(
+                    args.file_path, args.chunksize, args.engine, args.workers
+                ),
+            )
+        )
+    elif args.command == "memory_report":
+        print(memory_report(args.file_path, args.chunksize or 1_000_000))
+    elif args.command == "profile":
+        profile(
+            args.file_path,
+            args.version,
+            args.chunksize,
+            args.report,
+            args.engine,
+            args.duplicates_path,
+            args.encoder_path,
+            options,
+        )
 
 
 if __name__ == "__main__":
@@ -11,6 +11,9 @@ How to run the script:
 ----------------------
 python eda.py --input data/transform/insurance_000.parquet --output output/eda_combined_plots.png
 
+Only look at part of the data, e.g. one region of a partitioned dataset:
+python eda.py --input data/transform/insurance_000.parquet --output output/eda_region_1.png --filter "region == 1"
+
 Or
 make eda if Makefile is available in your working directory.
 
@@ -21,6 +24,7 @@ import pandas as pd
 import numpy as np
 import seaborn as sns
 from matplotlib import pyplot as plt
+from parquet_io import parse_filter, read_parquet
 
 # see versions of libraries
 print(f"python version: {sys.version}")
@@ -35,7 +39,9 @@ plt.style.use("ggplot")
 
 
 # Define a function to combine the plots into one figure
-def combine_plots() -> None:
+def combine_plots(
+    file_path: str = "data/transform/insurance_000.parquet", filters: list = None
+) -> None:
     """
     This function combines the following plots into one figure:
     1. Correlation Matrix Heatmap
@@ -44,7 +50,10 @@ def combine_plots() -> None:
 
     Parameters:
     ----------
-    None
+    file_path: str
+        Path to the encoded parquet file or dataset
+    filters: list
+        Row filters pushed down to the parquet reader, see parquet_io.parse_filter
 
     Returns:
     -------
@@ -54,9 +63,8 @@ def combine_plots() -> None:
     --------
     combine_plots()
     """
-    # load the parquet file
-    file_path = "data/transform/insurance_000.parquet"
-    df2 = pd.read_parquet(file_path)
+    # load the parquet file, skipping row groups the filters rule out
+    df2 = read_parquet(file_path, filters=filters)
 
     # confirm if it was successfully loaded
     print("First 5 rows of the dataframe:")
@@ -210,15 +218,19 @@ def main():
     # Add arguments
     parser.add_argument("--input", type=str, help="Path to the input data file")
     parser.add_argument("--output", type=str, help="Path to the output figure file")
+    parser.add_argument(
+        "--filter",
+        action="append",
+        default=[],
+        help='Row filter such as "region == 1", can be repeated',
+    )
 
     # Parse the arguments
     args = parser.parse_args()
 
-    # Load the data
-    df2 = pd.read_parquet(args.input)  # noqa:W0612
-
-    # Combine the plots
-    combine_plots()
+    # Load the data and combine the plots
+    filters = [parse_filter(expression) for expression in args.filter]
+    combine_plots(args.input, filters)
 
     # Save the combined figure
     plt.savefig(args.output)  # noqa:W0612
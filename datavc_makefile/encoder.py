@@ -0,0 +1,150 @@
+"""Persisted categorical encoder with stable vocabularies.
+
+The encoder is a JSON file holding the sorted vocabulary of every
+categorical column. Values are encoded through pandas category codes,
+so encoding a column whose categories already match the vocabulary is
+a plain code lookup without sorting. Values that are not in the
+vocabulary (and missing values) get the reserved code UNSEEN_CODE.
+
+Functions:
+----------
+fit_encoder: Build the vocabularies from the data.
+save_encoder: Save the vocabularies to a JSON file.
+load_encoder: Load the vocabularies from a JSON file.
+apply_encoder: Replace the categorical columns by their codes.
+
+How to use:
+-----------
+>>> vocabulary = fit_encoder(data, ["sex", "smoker", "region"])
+>>> save_encoder(vocabulary, "data/transform/encoder.json")
+>>> apply_encoder(new_data, load_encoder("data/transform/encoder.json"))
+"""
+
+import os
+import json
+import pandas as pd
+
+# Code given to values that were not seen when the encoder was fitted.
+# This is the code pandas gives values outside the categories.
+UNSEEN_CODE = -1
+
+
+def fit_encoder(data: pd.DataFrame, columns: list) -> dict:
+    """Build the sorted vocabulary of each column.
+
+    Sorted vocabularies give the same codes as LabelEncoder.
+
+    Parameters
+    ----------
+    data: pd.DataFrame :
+        The data to learn the vocabularies from.
+
+    columns: list :
+        The categorical columns.
+
+    Returns
+    -------
+    dict
+        Column name to sorted list of values.
+
+    Examples
+    --------
+    >>> fit_encoder(data, ["sex", "smoker", "region"])
+
+    """
+    vocabulary = {}
+    for column in columns:
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # only the categories that actually occur
+            categories = values.cat.remove_unused_categories().cat.categories
+        else:
+            categories = values.dropna().unique()
+        vocabulary[column] = sorted(categories.tolist())
+    return vocabulary
+
+
+def save_encoder(vocabulary: dict, path: str) -> None:
+    """Save the vocabularies to a JSON file.
+
+    Parameters
+    ----------
+    vocabulary: dict :
+        Column name to sorted list of values.
+
+    path: str :
+        The path of the JSON file.
+
+    Returns
+    -------
+    None
+
+    Examples
+    --------
+    >>> save_encoder(vocabulary, "data/transform/encoder.json")
+
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as outfile:
+        json.dump(
+            {"columns": vocabulary, "unseen_code": UNSEEN_CODE}, outfile, indent=2
+        )
+
+
+def load_encoder(path: str) -> dict:
+    """Load the vocabularies from a JSON file.
+
+    Parameters
+    ----------
+    path: str :
+        The path of the JSON file.
+
+    Returns
+    -------
+    dict
+        Column name to sorted list of values.
+
+    Examples
+    --------
+    >>> load_encoder("data/transform/encoder.json")
+
+    """
+    with open(path, "r") as infile:
+        return json.load(infile)["columns"]
+
+
+def apply_encoder(data: pd.DataFrame, vocabulary: dict) -> pd.DataFrame:
+    """Replace the categorical columns by their codes, in place.
+
+    Parameters
+    ----------
+    data: pd.DataFrame :
+        The data to encode.
+
+    vocabulary: dict :
+        Column name to sorted list of values.
+
+    Returns
+    -------
+    pd.DataFrame
+        The encoded data, with int64 codes.
+
+    Examples
+    --------
+    >>> apply_encoder(data, load_encoder("data/transform/encoder.json"))
+
+    """
+    for column, categories in vocabulary.items():
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            if values.cat.categories.tolist() != categories:
+                # recodes through a small lookup table, no sort of the data
+                values = values.cat.set_categories(categories)
+            codes = values.cat.codes
+        else:
+            codes = pd.Series(
+                pd.Categorical(values, categories=categories).codes, index=data.index
+            )
+        # int64 like LabelEncoder, pandas category codes can be as narrow as int8
+        data[column] = codes.astype("int64")
+    return data
@@ -43,6 +43,8 @@ from sklearn import tree
 from sklearn.preprocessing import StandardScaler
 import joblib
 from joblib import dump
+from encoder import load_encoder, save_encoder
+from splits import has_index_splits, load_split
 
 
 # see versions of libraries
@@ -83,13 +85,18 @@ parser.add_argument(
 # Parse the arguments
 args = parser.parse_args()
 
-# Load the data
-X_train = pd.read_parquet("data/transform/validation/X_train.parquet")
-X_test = pd.read_parquet("data/transform/validation/X_test.parquet")
-y_train = pd.read_parquet("data/transform/validation/y_train.parquet")
-y_test = pd.read_parquet("data/transform/validation/y_test.parquet")
-X_val = pd.read_parquet("data/transform/validation/X_val.parquet")
-y_val = pd.read_parquet("data/transform/validation/y_val.parquet")
+# Load the data, sliced from one memory mapped copy for index based splits
+if has_index_splits("data/transform/validation"):
+    X_train, y_train = load_split("data/transform/validation", "train")
+    X_test, y_test = load_split("data/transform/validation", "test")
+    X_val, y_val = load_split("data/transform/validation", "val")
+else:
+    X_train = pd.read_parquet("data/transform/validation/X_train.parquet")
+    X_test = pd.read_parquet("data/transform/validation/X_test.parquet")
+    y_train = pd.read_parquet("data/transform/validation/y_train.parquet")
+    y_test = pd.read_parquet("data/transform/validation/y_test.parquet")
+    X_val = pd.read_parquet("data/transform/validation/X_val.parquet")
+    y_val = pd.read_parquet("data/transform/validation/y_val.parquet")
 
 # Scale the data
 scaler = StandardScaler()
@@ -135,11 +142,11 @@ print(
 
 # store the metrics in a dictionary
 metrics = {
-    "linear_model_mae": mean_absolute_error(y_test, y_pred_linear_test),
-    "tree_model_score": tree_model.score(X_test, y_test),
-    "linear_model_score_val": linear_model_scaled.score(X_val_scaled, y_val),
-    "tree_model_score_val": tree_model.score(X_val, y_val),
-    "linear_model_score_poly_val": linear_model_poly.score(X_val_poly, y_val),
+    "linear_model_mae": float(mean_absolute_error(y_test, y_pred_linear_test)),
+    "tree_model_score": float(tree_model.score(X_test, y_test)),
+    "linear_model_score_val": float(linear_model_scaled.score(X_val_scaled, y_val)),
+    "tree_model_score_val": float(tree_model.score(X_val, y_val)),
+    "linear_model_score_poly_val": float(linear_model_poly.score(X_val_poly, y_val)),
 }
 
 # write the metrics to a JSON file
@@ -155,6 +162,10 @@ tree.plot_tree(tree_model, feature_names=X_train.columns, filled=True)
 # Save the models: linear_model_scaled and tree_model
 dump(linear_model_scaled, "model_output/linear_model_scaled.joblib")
 dump(tree_model, "model_output/tree_model.joblib")
+
+# Ship the encoder vocabularies with the models so scoring raw data
+# uses the same category codes the models were trained on
+save_encoder(load_encoder("data/transform/encoder.json"), "model_output/encoder.json")
 plt.savefig("output/decision_tree.png")
 
 # Narrative on the findings
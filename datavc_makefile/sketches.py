@@ -0,0 +1,461 @@
+"""Approximate summary statistics from small mergeable sketches.
+
+Every column gets a fixed size sketch, no matter how many rows it has:
+
+- QuantileSketch: a t-digest of weighted centroids for quantiles.
+- DistinctSketch: a HyperLogLog for the number of unique values.
+- FrequentItems: Misra-Gries counters for the most frequent values.
+
+Sketches built from different chunks, shards or workers merge into the
+sketch of the combined data. The sketch of an encoded parquet dataset is
+saved next to it, so later summaries of the same version are instant.
+
+Classes:
+--------
+QuantileSketch: Approximate quantiles.
+DistinctSketch: Approximate number of unique values.
+FrequentItems: Approximate most frequent values.
+DataSketch: The sketches of every column of a table.
+
+Functions:
+----------
+sketch_parquet: The (cached) sketch of a parquet file or dataset.
+
+How to use:
+-----------
+>>> sketch = DataSketch()
+>>> for chunk in pd.read_csv("data/original_data/insurance.csv", chunksize=100_000):
+...     sketch.update(chunk)
+>>> sketch.summary()
+>>> sketch_parquet("data/transform/insurance_000.parquet").summary()
+"""
+
+import os
+import json
+import base64
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+class QuantileSketch:
+    """Approximate quantiles from a t-digest.
+
+    The values are kept as weighted centroids. Centroids are small in
+    the tails and large around the median, so extreme quantiles stay
+    accurate. About compression / 2 centroids are kept.
+    """
+
+    def __init__(self, compression: int = 200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.low = np.inf
+        self.high = -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.low = min(self.low, values.min())
+        self.high = max(self.high, values.max())
+        self._compress(
+            np.concatenate([self.means, values]),
+            np.concatenate([self.weights, np.ones(len(values))]),
+        )
+
+    def merge(self, other: "QuantileSketch"):
+        if not len(other.means):
+            return
+        self.low = min(self.low, other.low)
+        self.high = max(self.high, other.high)
+        self._compress(
+            np.concatenate([self.means, other.means]),
+            np.concatenate([self.weights, other.weights]),
+        )
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        # quantile at the left edge of every centroid on the arcsine scale,
+        # centroids falling in the same unit of the scale are merged
+        left = (np.cumsum(weights) - weights) / weights.sum()
+        scale = self.compression / (2 * np.pi) * np.arcsin(2 * left - 1)
+        bins = np.floor(scale - scale[0])
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantile(self, q):
+        """Approximate q quantile(s), interpolated like pandas."""
+        if not len(self.means):
+            return np.full(np.shape(q), np.nan)[()]
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.r_[0.0, centers, total]
+        values = np.r_[self.low, self.means, self.high]
+        return np.interp(np.asarray(q) * (total - 1) + 0.5, positions, values)
+
+    def to_dict(self) -> dict:
+        return {
+            "compression": self.compression,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "low": self.low if len(self.means) else None,
+            "high": self.high if len(self.means) else None,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "QuantileSketch":
+        sketch = cls(state["compression"])
+        sketch.means = np.asarray(state["means"], dtype=np.float64)
+        sketch.weights = np.asarray(state["weights"], dtype=np.float64)
+        if state["low"] is not None:
+            sketch.low, sketch.high = state["low"], state["high"]
+        return sketch
+
+
+class DistinctSketch:
+    """Approximate number of unique values from a HyperLogLog.
+
+    2 ** precision one byte registers, a relative error of about
+    1.04 / sqrt(2 ** precision), 0.8% for the default precision.
+    """
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, values: pd.Series):
+        values = values.dropna()
+        if not len(values):
+            return
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        bits = 64 - self.precision
+        index = (hashes >> np.uint64(bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << bits) - 1)
+        # rank is the position of the leftmost one bit of the other bits
+        rank = np.full(len(rest), bits + 1, dtype=np.uint8)
+        nonzero = rest > 0
+        rest = rest[nonzero]
+        highest = np.floor(np.log2(rest.astype(np.float64))).astype(np.uint64)
+        # float rounding can overshoot just below a power of two
+        highest -= (np.left_shift(np.uint64(1), highest) > rest).astype(np.uint64)
+        rank[nonzero] = bits - highest.astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "DistinctSketch"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        """Approximate number of unique values."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(np.float64))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            # linear counting is more accurate for few unique values
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self) -> dict:
+        return {
+            "precision": self.precision,
+            "registers": base64.b64encode(self.registers.tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "DistinctSketch":
+        sketch = cls(state["precision"])
+        registers = base64.b64decode(state["registers"])
+        sketch.registers = np.frombuffer(registers, dtype=np.uint8).copy()
+        return sketch
+
+
+class FrequentItems:
+    """Approximate most frequent values from Misra-Gries counters.
+
+    At most capacity values are counted. The counts are lower bounds,
+    at most `error` below the true counts, and exact while the column
+    has no more than capacity unique values.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.float64)
+        self.error = 0.0
+
+    def update(self, values: pd.Series):
+        self._add(values.value_counts(), 0.0)
+
+    def merge(self, other: "FrequentItems"):
+        self._add(other.counts, other.error)
+
+    def _add(self, counts: pd.Series, error: float):
+        counts = counts[counts > 0].astype(np.float64)
+        if not len(self.counts):
+            combined = counts
+        else:
+            combined = pd.concat([self.counts, counts]).groupby(level=0).sum()
+        self.error += error
+        if len(combined) > self.capacity:
+            # subtracting the (capacity + 1)th largest count keeps at most capacity
+            cutoff = combined.nlargest(self.capacity + 1).iloc[-1]
+            combined = combined[combined > cutoff] - cutoff
+            self.error += cutoff
+        self.counts = combined
+
+    def top(self, n: int = 1) -> pd.Series:
+        """The n most frequent values and their (lower bound) counts."""
+        return self.counts.nlargest(n)
+
+    def to_dict(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "values": [_to_json(value) for value in self.counts.index],
+            "counts": self.counts.tolist(),
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "FrequentItems":
+        sketch = cls(state["capacity"])
+        sketch.counts = pd.Series(
+            state["counts"], index=state["values"], dtype=np.float64
+        )
+        sketch.error = state["error"]
+        return sketch
+
+
+class DataSketch:
+    """The sketches of every column of a table.
+
+    Numeric columns get exact count, mean, std, min and max plus a
+    QuantileSketch for the quartiles. All columns get a DistinctSketch, other columns
+    a FrequentItems sketch.
+    """
+
+    rows = [
+        "count",
+        "unique",
+        "top",
+        "freq",
+        "mean",
+        "std",
+        "min",
+        "25%",
+        "50%",
+        "75%",
+        "max",
+    ]
+
+    def __init__(self):
+        self.columns = {}
+
+    def update(self, chunk: pd.DataFrame):
+        for name in chunk.columns:
+            values = chunk[name]
+            numeric = pd.api.types.is_numeric_dtype(
+                values
+            ) and not pd.api.types.is_bool_dtype(values)
+            column = self.columns.setdefault(name, _ColumnSketch(numeric))
+            column.update(values)
+
+    def merge(self, other: "DataSketch"):
+        for name, column in other.columns.items():
+            if name in self.columns:
+                self.columns[name].merge(column)
+            else:
+                self.columns[name] = column
+
+    def summary(self) -> pd.DataFrame:
+        """describe() like statistics, quantiles and unique approximated."""
+        result = {name: column.summary() for name, column in self.columns.items()}
+        return pd.DataFrame(result).reindex(index=self.rows, columns=list(result))
+
+    def to_dict(self) -> dict:
+        return {name: column.to_dict() for name, column in self.columns.items()}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "DataSketch":
+        sketch = cls()
+        sketch.columns = {
+            name: _ColumnSketch.from_dict(column) for name, column in state.items()
+        }
+        return sketch
+
+
+class _ColumnSketch:
+    """Exact moments plus the approximate sketches of one column."""
+
+    def __init__(self, numeric: bool):
+        self.numeric = numeric
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.distinct = DistinctSketch()
+        self.quantiles = QuantileSketch() if numeric else None
+        self.frequent = None if numeric else FrequentItems()
+
+    def update(self, values: pd.Series):
+        self.distinct.update(values)
+        if not self.numeric:
+            self.count += int(values.count())
+            self.frequent.update(values)
+            return
+        values = values.dropna().to_numpy(dtype=np.float64)
+        if len(values):
+            mean = values.mean()
+            self._merge_moments(len(values), mean, ((values - mean) ** 2).sum())
+            self.quantiles.update(values)
+
+    def merge(self, other: "_ColumnSketch"):
+        self.distinct.merge(other.distinct)
+        if not self.numeric:
+            self.count += other.count
+            self.frequent.merge(other.frequent)
+            return
+        if other.count:
+            self._merge_moments(other.count, other.mean, other.m2)
+            self.quantiles.merge(other.quantiles)
+
+    def _merge_moments(self, n: int, mean: float, m2: float):
+        # Chan et al. parallel update of count, mean and M2
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta**2 * self.count * n / total
+        self.count = total
+
+    def summary(self) -> dict:
+        result = {"count": self.count, "unique": self.distinct.count()}
+        if not self.numeric:
+            top = self.frequent.top()
+            if len(top):
+                result["top"] = top.index[0]
+                result["freq"] = int(top.iloc[0])
+            return result
+        n = self.count
+        lower, median, upper = self.quantiles.quantile([0.25, 0.5, 0.75])
+        result.update(
+            {
+                "mean": self.mean if n else np.nan,
+                "std": np.sqrt(self.m2 / (n - 1)) if n > 1 else np.nan,
+                "min": self.quantiles.low if n else np.nan,
+                "25%": lower,
+                "50%": median,
+                "75%": upper,
+                "max": self.quantiles.high if n else np.nan,
+            }
+        )
+        return result
+
+    def to_dict(self) -> dict:
+        state = {
+            "numeric": self.numeric,
+            "count": self.count,
+            "distinct": self.distinct.to_dict(),
+        }
+        if self.numeric:
+            state.update(mean=self.mean, m2=self.m2, quantiles=self.quantiles.to_dict())
+        else:
+            state["frequent"] = self.frequent.to_dict()
+        return state
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "_ColumnSketch":
+        column = cls(state["numeric"])
+        column.count = state["count"]
+        column.distinct = DistinctSketch.from_dict(state["distinct"])
+        if column.numeric:
+            column.mean, column.m2 = state["mean"], state["m2"]
+            column.quantiles = QuantileSketch.from_dict(state["quantiles"])
+        else:
+            column.frequent = FrequentItems.from_dict(state["frequent"])
+        return column
+
+
+def sketch_parquet(
+    path: str, workers: int = None, batch_size: int = 1_000_000
+) -> DataSketch:
+    """The sketch of a parquet file or dataset, cached next to it.
+
+    The sketch is saved to <name>.sketch.json together with the size and
+    modification time of every parquet file. It is reused while those are
+    unchanged, otherwise every file is sketched in a process pool, one
+    batch at a time, and the per file sketches are merged.
+
+    Parameters
+    ----------
+    path: str :
+        Parquet file or dataset directory.
+
+    workers: int :
+        Number of processes. (Default value = None, one per CPU)
+
+    batch_size: int :
+        Rows read at a time from each file. (Default value = 1_000_000)
+
+    Returns
+    -------
+    DataSketch
+        The sketch of the data.
+
+    Examples
+    --------
+    >>> sketch_parquet("data/transform/insurance_000.parquet").summary()
+
+    """
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    fragments = [
+        (fragment.path, ds.get_partition_keys(fragment.partition_expression))
+        for fragment in dataset.get_fragments()
+    ]
+    fingerprint = [
+        [file, os.path.getsize(file), os.stat(file).st_mtime_ns]
+        for file, _ in sorted(fragments)
+    ]
+    sketch_path = sketch_file(path)
+    if os.path.exists(sketch_path):
+        with open(sketch_path, "r") as infile:
+            cached = json.load(infile)
+        if cached["files"] == fingerprint:
+            print(f"Sketch loaded from {sketch_path}")
+            return DataSketch.from_dict(cached["sketch"])
+
+    sketch = DataSketch()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for part in pool.map(
+            _sketch_fragment, fragments, [batch_size] * len(fragments)
+        ):
+            sketch.merge(part)
+    with open(sketch_path, "w") as outfile:
+        json.dump({"files": fingerprint, "sketch": sketch.to_dict()}, outfile)
+    print(f"Sketch saved to {sketch_path}")
+    return sketch
+
+
+def sketch_file(path: str) -> str:
+    """Path of the sketch saved next to a parquet file or dataset."""
+    root, extension = os.path.splitext(path.rstrip("/"))
+    return (root if extension == ".parquet" else path.rstrip("/")) + ".sketch.json"
+
+
+def _sketch_fragment(fragment: tuple, batch_size: int) -> DataSketch:
+    """Sketch of one parquet file, with its partition columns added."""
+    path, partition = fragment
+    sketch = DataSketch()
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        chunk = batch.to_pandas()
+        for column, value in partition.items():
+            chunk[column] = value
+        sketch.update(chunk)
+    return sketch
+
+
+def _to_json(value):
+    """Plain Python value for numpy scalars."""
+    return value.item() if isinstance(value, np.generic) else value
@@ -10,6 +10,23 @@ How to run:
 python split_data.py --data data/transform/insurance_000.parquet --strategy kfold --test_size 0.2 --n_splits 5
 python split_data.py --data data/transform/insurance_000.parquet --strategy train_test_split --test_size 0.2
 
+Only read some columns or rows; filters skip partitions and row groups:
+python split_data.py --data data/transform/insurance_000.parquet --columns age bmi smoker --filter "region == 1"
+
+Write the data once, one compact file per column, with a fold id per row
+for all folds and the train/test/val masks, instead of six parquet copies:
+python split_data.py --data data/transform/insurance_000.parquet --strategy kfold --n_splits 10 --index_only
+
+Split out of core, chunk by chunk, from a hash of a key (default the whole
+row) and a seed. Appended rows never move existing rows between splits:
+python split_data.py --data data/transform/insurance_000.parquet --strategy hash --seed 42
+
+Every split is kept in data/transform/splits/<key>, keyed by a hash of the
+input content and the parameters, and linked into data/transform/validation,
+or the directory given by --output_dir. Running the same split again only
+relinks the cached files:
+python split_data.py --data data/transform/insurance_000.parquet --strategy kfold --output_dir data/transform/validation_kfold
+
 Things to try:
 --------------
 - Remove the smoker column from the data since it is highly correlated with the charges column.
@@ -20,11 +37,28 @@ Things to try:
 
 import os
 import sys
+import json
+import shutil
 import argparse
+import tempfile
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import sklearn
 from sklearn.model_selection import train_test_split
 from sklearn.model_selection import KFold
+import parquet_io
+from parquet_io import iter_parquet, parse_filter, read_parquet
+import splits
+from splits import (
+    SPLIT_CACHE,
+    SPLIT_CODES,
+    hash_split,
+    publish_split,
+    save_index_splits,
+    split_cache_key,
+)
 
 # package versions: python, pandas, sklearn
 print("python:", sys.version)
@@ -32,6 +66,73 @@ print("pandas:", pd.__version__)
 print("sklearn:", sklearn.__version__)
 
 
+def hash_split_data(
+    data: str,
+    output_dir: str,
+    test_size: float,
+    seed: int = 42,
+    key: list = None,
+    columns: list = None,
+    filters: list = None,
+    chunksize: int = 1_000_000,
+) -> dict:
+    """Split a parquet file chunk by chunk from a hash of each row's key.
+
+    Parameters
+    ----------
+    data: str
+        Path to the input parquet file or dataset
+    output_dir: str
+        Directory to write the X_*/y_*.parquet files to
+    test_size: float
+        Test set size, the validation set is test_size of the rest
+    seed: int
+        Seed mixed into the row hashes
+    key: list
+        Columns identifying a row, default the whole row
+    columns: list
+        Columns to read, default all
+    filters: list
+        Row filters as (column, op, value) tuples
+    chunksize: int
+        Rows in memory at a time
+
+    Returns:
+    --------
+    dict
+        Number of rows per split
+    """
+    read_columns = None
+    if columns is not None:
+        read_columns = columns + [c for c in key or [] if c not in columns]
+    writers = {}
+    rows = dict.fromkeys(SPLIT_CODES, 0)
+    try:
+        for chunk in iter_parquet(data, read_columns, filters, chunksize):
+            split = hash_split(chunk, test_size, seed, key)
+            if columns is not None:
+                chunk = chunk[columns]
+            for name, code in SPLIT_CODES.items():
+                part = chunk[split == code]
+                rows[name] += len(part)
+                outputs = {
+                    f"X_{name}": part.drop(columns=["charges"]),
+                    f"y_{name}": part[["charges"]],
+                }
+                for output, frame in outputs.items():
+                    table = pa.Table.from_pandas(frame, preserve_index=False)
+                    if output not in writers:
+                        writers[output] = pq.ParquetWriter(
+                            os.path.join(output_dir, f"{output}.parquet"),
+                            table.schema,
+                        )
+                    writers[output].write_table(table)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return rows
+
+
 def main():
     """
     this function will split the data into train, test, and validation sets
@@ -47,6 +148,18 @@ def main():
     n_splits: int
         Number of folds for KFold
         Note: n_splits is only used when strategy is kfold
+    columns: list
+        Feature columns to read, charges is always read
+    filter: list
+        Row filters such as "region == 1", pushed down to the parquet reader
+    seed: int
+        Seed of the hash strategy
+    key: list
+        Columns identifying a row for the hash strategy, default the whole row
+    output_dir: str
+        Directory the split is linked into, default data/transform/validation
+    index_only: bool
+        Write the columns once with split codes and fold ids instead of parquet copies
 
     Returns:
     --------
@@ -66,7 +179,7 @@ def main():
     )
     parser.add_argument(
         "--strategy",
-        choices=["train_test_split", "kfold"],
+        choices=["train_test_split", "kfold", "hash"],
         default="train_test_split",
         help="Cross validation strategy",
     )
@@ -74,34 +187,155 @@ def main():
     parser.add_argument(
         "--n_splits", type=int, default=5, help="Number of folds for KFold"
     )
+    parser.add_argument(
+        "--columns", nargs="+", help="Feature columns to read (default all)"
+    )
+    parser.add_argument(
+        "--filter",
+        action="append",
+        default=[],
+        help='Row filter such as "region == 1", can be repeated',
+    )
+    parser.add_argument(
+        "--seed", type=int, default=42, help="Seed of the hash strategy"
+    )
+    parser.add_argument(
+        "--key",
+        nargs="+",
+        help="hash strategy: columns identifying a row (default the whole row)",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default="data/transform/validation",
+        help="Directory the split is linked into",
+    )
+    parser.add_argument(
+        "--index_only",
+        action="store_true",
+        help="Write the data once with fold ids and split masks, see splits.py",
+    )
     args = parser.parse_args()
+    if args.strategy == "hash" and args.index_only:
+        parser.error("--index_only needs the full data, use kfold or train_test_split")
+
+    columns = args.columns + ["charges"] if args.columns else None
+    filters = [parse_filter(expression) for expression in args.filter]
+
+    # Splits are cached by the input content, the scripts and the parameters
+    params = {
+        "strategy": args.strategy,
+        "test_size": args.test_size,
+        "n_splits": args.n_splits if args.strategy == "kfold" else None,
+        "seed": args.seed if args.strategy == "hash" else None,
+        "key": args.key if args.strategy == "hash" else None,
+        "columns": columns,
+        "filters": filters,
+        "index_only": args.index_only,
+    }
+    scripts = [
+        os.path.abspath(__file__),
+        os.path.abspath(splits.__file__),
+        os.path.abspath(parquet_io.__file__),
+    ]
+    key = split_cache_key([args.data] + scripts, params)
+    cache_dir = os.path.join(SPLIT_CACHE, key)
+
+    if os.path.isdir(cache_dir):
+        print(f"Reusing the cached split in {cache_dir}")
+    else:
+        # written next to the cache entry, then renamed into place at once
+        os.makedirs(SPLIT_CACHE, exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix=f"{key}.", dir=SPLIT_CACHE)
+        try:
+            write_splits(args, columns, filters, work_dir)
+            with open(os.path.join(work_dir, "params.json"), "w") as outfile:
+                json.dump({"key": key, "data": args.data, **params}, outfile, indent=2)
+            try:
+                os.rename(work_dir, cache_dir)
+            except OSError:
+                # an identical split finished first
+                pass
+        finally:
+            # nothing is left behind when the split fails or loses the race
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Link the split into the output directory: train, test, and val
+    publish_split(cache_dir, args.output_dir)
+    print(f"Split {key} ({args.strategy}) available in {args.output_dir}")
+
+
+def write_splits(
+    args: argparse.Namespace, columns: list, filters: list, output_dir: str
+) -> None:
+    """
+    Split the data with the strategy in args and write the splits to output_dir
+
+    Parameters:
+    -----------
+    args: argparse.Namespace
+        The parsed command line arguments of main
+    columns: list
+        Columns to read, default all
+    filters: list
+        Row filters as (column, op, value) tuples
+    output_dir: str
+        Directory to write the splits to
 
-    # Load the cleaned data
-    df3 = pd.read_parquet(args.data)
+    Returns:
+    --------
+    None
+    """
+    if args.strategy == "hash":
+        rows = hash_split_data(
+            args.data,
+            output_dir,
+            args.test_size,
+            args.seed,
+            args.key,
+            columns,
+            filters,
+        )
+        print("Train set rows:", rows["train"])
+        print("Test set rows:", rows["test"])
+        print("Validation set rows:", rows["val"])
+        return
+
+    # Load the cleaned data, only the requested columns and rows
+    df3 = read_parquet(args.data, columns=columns, filters=filters)
 
     # Define the independent and dependent variables
     X = df3.drop(columns=["charges"], axis=1)
     y = df3["charges"]
 
-    # Define the output directory: train, test, and val
-    output_dir = "data/transform/validation"
-    os.makedirs(output_dir, exist_ok=True)
-
+    # Split row numbers, the same rows as splitting the frames themselves
+    fold = None
     if args.strategy == "train_test_split":
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=args.test_size, random_state=42
-        )
-        X_train, X_val, y_train, y_val = train_test_split(
-            X_train, y_train, test_size=args.test_size, random_state=42
+        train_rows, test_rows = train_test_split(
+            np.arange(len(X)), test_size=args.test_size, random_state=42
         )
     else:
+        # fold id of every row, the first fold is the test set and the
+        # others are the cross validation folds of the train rows
         kf = KFold(n_splits=args.n_splits, random_state=42, shuffle=True)
-        train_indices, test_indices = next(kf.split(X))
-        X_train, X_test = X.iloc[train_indices], X.iloc[test_indices]
-        y_train, y_test = y.iloc[train_indices], y.iloc[test_indices]
-        X_train, X_val, y_train, y_val = train_test_split(
-            X_train, y_train, test_size=args.test_size, random_state=42
-        )
+        fold = np.empty(len(X), dtype=np.int8)
+        for k, (_, fold_rows) in enumerate(kf.split(X)):
+            fold[fold_rows] = k
+        train_rows, test_rows = np.flatnonzero(fold != 0), np.flatnonzero(fold == 0)
+    train_rows, val_rows = train_test_split(
+        train_rows, test_size=args.test_size, random_state=42
+    )
+
+    if args.index_only:
+        rows = {"train": train_rows, "test": test_rows, "val": val_rows}
+        save_index_splits(output_dir, X, y, rows, fold)
+        print("Train set rows:", len(train_rows))
+        print("Test set rows:", len(test_rows))
+        print("Validation set rows:", len(val_rows))
+        return
+
+    X_train, X_test, X_val = X.iloc[train_rows], X.iloc[test_rows], X.iloc[val_rows]
+    y_train, y_test, y_val = y.iloc[train_rows], y.iloc[test_rows], y.iloc[val_rows]
 
     # Print the shapes of the data
     print("Train set shape:", X_train.shape)